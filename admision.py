@@ -0,0 +1,253 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from respuestas import a_json
+from metricas import Contador, Indicador
+
+# Control de admisión por worker. Las rutas pesadas (parsear un Excel, extraer un ZIP)
+# pasan por un cupo de trabajos simultáneos y un presupuesto de memoria; si no entran
+# esperan en una cola acotada, y con la cola llena se responde 429 con Retry-After.
+# El lugar lo pide el endpoint (pedir_turno_pesado) recién cuando va a hacer el trabajo:
+# una respuesta servida desde la caché de resultados no ocupa cupo ni memoria. Los parseos
+# de ?modo=async comparten el mismo cupo (turno_para_trabajo) desde su tarea de fondo.
+# El resto de las rutas (consultas por código, catálogo, subidas JSON) no pasa por acá:
+# nunca quedan esperando detrás de un parseo.
+ADMISION_PESADAS_CONCURRENTES = int(os.getenv("ADMISION_PESADAS_CONCURRENTES", "2"))
+ADMISION_COLA_MAX = int(os.getenv("ADMISION_COLA_MAX", "4"))
+ADMISION_ESPERA_MAX = float(os.getenv("ADMISION_ESPERA_MAX", "60"))     # segundos en cola antes del 429
+ADMISION_MEMORIA_MB = int(os.getenv("ADMISION_MEMORIA_MB", "1536"))     # pico estimado sumado de las pesadas
+# Tope de cualquier cuerpo de petición (comprimido, tal como llega: el middleware va por fuera del de descompresión)
+MAX_SUBIDA = int(os.getenv("MAX_SUBIDA_MB", "200")) * 1024 * 1024
+
+MB = 1024 * 1024
+
+# Pico de memoria estimado por byte del archivo subido, medido con libros sintéticos (benchmarks/):
+# un .xlsx de 3 MB con 100k filas sube el RSS ~90 MB (XML descomprimido + un dict por fila).
+# El ZIP se extrae a disco y se consulta con SQLite: pesa poco más que el archivo.
+RUTAS_PESADAS = {
+    "/procesar-inventario-completo": 30,
+    "/leer-excel": 30,
+    "/procesar-zip-sqlite": 3,
+}
+# Memoria fija de cualquier trabajo pesado (imports, pool de hojas, buffers)
+MEMORIA_BASE = 32 * MB
+
+# Retry-After cuando todavía no hay duraciones medidas
+RETRY_AFTER_INICIAL = 10
+
+rechazos = Contador("admision_rechazos_total", "Peticiones pesadas rechazadas con 429 (cola llena o espera vencida)")
+subidas_rechazadas = Contador("admision_subidas_grandes_total", "Peticiones rechazadas con 413 por superar MAX_SUBIDA_MB")
+
+def ruta_pesada(path: str):
+    """Factor de memoria de la ruta si es pesada, o None."""
+    return RUTAS_PESADAS.get(path.rstrip("/"))
+
+def estimar_memoria(factor: int, tamano: int) -> int:
+    return MEMORIA_BASE + factor * tamano
+
+class ControlAdmision:
+    """
+    Cupo de trabajos pesados con presupuesto de memoria y cola FIFO acotada.
+    Un trabajo entra si hay lugar en el cupo y su estimación cabe en lo que queda del
+    presupuesto; uno más grande que el presupuesto entero entra solo cuando no hay
+    nada corriendo. Se usa solo desde el event loop (sin locks).
+    """
+
+    def __init__(self, concurrentes: int, cola_max: int, memoria: int):
+        self.concurrentes = concurrentes
+        self.cola_max = cola_max
+        self.memoria = memoria
+        self.en_curso = 0
+        self.memoria_en_uso = 0
+        self._cola = deque()        # (estimado, future) en orden de llegada
+        self._duracion_media = None
+
+    @property
+    def en_cola(self) -> int:
+        return len(self._cola)
+
+    def _entra(self, estimado: int) -> bool:
+        if self.en_curso >= self.concurrentes:
+            return False
+        return self.en_curso == 0 or self.memoria_en_uso + estimado <= self.memoria
+
+    def _ocupar(self, estimado: int):
+        self.en_curso += 1
+        self.memoria_en_uso += estimado
+
+    def retry_after(self) -> int:
+        """Segundos sugeridos para reintentar: lo que tardaría en vaciarse la cola actual."""
+        if self._duracion_media is None:
+            return RETRY_AFTER_INICIAL
+        tandas = (self.en_cola + 1) / max(self.concurrentes, 1)
+        return max(1, math.ceil(self._duracion_media * tandas))
+
+    async def entrar(self, estimado: int, espera_max, acotada: bool = True) -> bool:
+        """
+        True si el trabajo quedó admitido (hay que llamar a `salir`), False si se rechaza.
+        Con espera_max=None espera sin límite; con acotada=False no lo frena la cola llena.
+        """
+        # Sin colarse: si ya hay gente esperando, se respeta el orden
+        if not self._cola and self._entra(estimado):
+            self._ocupar(estimado)
+            return True
+        if acotada and self.en_cola >= self.cola_max:
+            return False
+        turno = asyncio.get_running_loop().create_future()
+        entrada = (estimado, turno)
+        self._cola.append(entrada)
+        try:
+            await asyncio.wait_for(turno, espera_max)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            if turno.done() and not turno.cancelled():
+                # Cancelada justo después de ser admitida: se devuelve el lugar
+                self.salir(estimado, None)
+            raise
+        finally:
+            if turno.cancelled():
+                # Sigue en la cola (a los admitidos se los saca antes de darles el turno)
+                self._cola.remove(entrada)
+                self._despertar()
+
+    def salir(self, estimado: int, duracion):
+        self.en_curso -= 1
+        self.memoria_en_uso -= estimado
+        if duracion is not None:
+            # Media móvil: alcanza para sugerir un Retry-After razonable
+            self._duracion_media = duracion if self._duracion_media is None else 0.8 * self._duracion_media + 0.2 * duracion
+        self._despertar()
+
+    def _despertar(self):
+        # FIFO estricto: si el primero no entra, los de atrás tampoco pasan
+        while self._cola and self._entra(self._cola[0][0]):
+            estimado, turno = self._cola.popleft()
+            self._ocupar(estimado)
+            turno.set_result(None)
+
+control_pesadas = ControlAdmision(ADMISION_PESADAS_CONCURRENTES, ADMISION_COLA_MAX, ADMISION_MEMORIA_MB * MB)
+
+Indicador("admision_pesadas_en_curso", "Trabajos pesados corriendo en este worker", lambda: control_pesadas.en_curso)
+Indicador("admision_pesadas_en_cola", "Trabajos pesados esperando turno", lambda: control_pesadas.en_cola)
+Indicador("admision_memoria_estimada_bytes", "Pico de memoria estimado de los trabajos en curso", lambda: control_pesadas.memoria_en_uso)
+
+class TurnoPesado:
+    """
+    Lugar en el cupo de una petición a una ruta pesada. Lo crea el middleware y lo
+    pide el endpoint con el tamaño real del archivo, después de mirar la caché; el
+    middleware lo devuelve cuando termina la respuesta (incluido un stream NDJSON).
+    """
+
+    def __init__(self, control: ControlAdmision, factor: int, en_segundo_plano: bool = False):
+        self.control = control
+        self.factor = factor
+        self.en_segundo_plano = en_segundo_plano
+        self._estimado = None
+        self._inicio = None
+
+    async def pedir(self, tamano: int):
+        if self._estimado is not None:
+            return
+        estimado = estimar_memoria(self.factor, tamano)
+        if self.en_segundo_plano:
+            # Ya se respondió 202: espera su turno sin 429. Son pocos, cola_trabajos los
+            # deja pasar de a TRABAJOS_CONCURRENTES por worker.
+            await self.control.entrar(estimado, None, acotada=False)
+        elif not await self.control.entrar(estimado, ADMISION_ESPERA_MAX):
+            rechazos.incrementar()
+            raise HTTPException(
+                status_code=429,
+                detail="Hay demasiados archivos procesándose, reintentá en unos segundos",
+                headers={"Retry-After": str(self.control.retry_after())},
+            )
+        self._estimado = estimado
+        self._inicio = time.perf_counter()
+
+    def liberar(self):
+        if self._estimado is not None:
+            self.control.salir(self._estimado, time.perf_counter() - self._inicio)
+            self._estimado = None
+
+async def pedir_turno_pesado(request, tamano: int):
+    """
+    Desde un endpoint pesado, antes del trabajo caro (no para una respuesta de la caché).
+    Espera turno o lanza HTTPException 429 con Retry-After. Fuera del middleware no hace nada.
+    """
+    turno = request.scope.get("state", {}).get("turno_pesado")
+    if turno is not None:
+        await turno.pedir(tamano)
+
+def turno_para_trabajo(path: str) -> TurnoPesado:
+    """Turno de una ruta pesada para su trabajo en segundo plano; liberarlo al terminar."""
+    return TurnoPesado(control_pesadas, ruta_pesada(path), en_segundo_plano=True)
+
+async def _responder(send, status: int, detalle: str, cabeceras=()):
+    cuerpo = a_json({"detail": detalle})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(cuerpo)).encode()),
+            *cabeceras,
+        ],
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
+
+class AdmisionMiddleware:
+    """
+    Rechaza con 413 los cuerpos de más de MAX_SUBIDA_MB (por Content-Length, o
+    contando mientras llegan si no lo traen) sin llegar a leerlos. A las rutas
+    pesadas les deja un TurnoPesado en `request.state.turno_pesado` y lo libera
+    al terminar la respuesta.
+    """
+
+    def __init__(self, app, control: ControlAdmision = control_pesadas, maximo: int = MAX_SUBIDA):
+        self.app = app
+        self.control = control
+        self.maximo = maximo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        largo = Headers(scope=scope).get("content-length")
+        largo = int(largo) if largo and largo.isdigit() else None
+        if largo is not None and largo > self.maximo:
+            subidas_rechazadas.incrementar()
+            return await _responder(send, 413, f"El archivo supera {self.maximo // MB} MB")
+        if largo is None:
+            receive = self._limitar(receive)
+
+        factor = ruta_pesada(scope["path"])
+        if factor is None:
+            return await self.app(scope, receive, send)
+
+        turno = TurnoPesado(self.control, factor)
+        # Copia del estado: el de uvicorn es propio de cada petición, pero no hay que depender de eso
+        scope = {**scope, "state": {**scope.get("state", {}), "turno_pesado": turno}}
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            turno.liberar()
+
+    def _limitar(self, receive):
+        total = 0
+
+        async def recibir():
+            nonlocal total
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                total += len(mensaje.get("body", b""))
+                if total > self.maximo:
+                    subidas_rechazadas.incrementar()
+                    raise HTTPException(status_code=413, detail=f"El archivo supera {self.maximo // MB} MB")
+            return mensaje
+
+        return recibir
@@ -0,0 +1,75 @@
+"""
+Benchmark: costo de arranque de la API.
+
+Mide en procesos nuevos (sin nada en caché de módulos):
+  - import: cuánto tarda `import main` y si arrastra pandas/numpy/openpyxl
+  - arranque: desde lanzar uvicorn hasta que GET / responde, con y sin
+    INICIALIZAR_ESQUEMA (create_all + migraciones + catálogo)
+
+Usa la base configurada en el entorno (DATABASE_URL o PG*), igual que la app.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_arranque
+    python -m benchmarks.bench_arranque --repeticiones 10 --puerto 8090
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+MODULOS_PESADOS = ("pandas", "numpy", "openpyxl")
+
+CODIGO_IMPORT = (
+    "import sys, time; t = time.perf_counter(); import main; "
+    "print(time.perf_counter() - t); "
+    f"print(','.join(m for m in {MODULOS_PESADOS!r} if m in sys.modules))"
+)
+
+def medir_import():
+    salida = subprocess.run(
+        [sys.executable, "-c", CODIGO_IMPORT], capture_output=True, text=True, check=True
+    ).stdout.split("\n")
+    return float(salida[0]), salida[1]
+
+def medir_arranque(puerto, inicializar):
+    entorno = {**os.environ, "INICIALIZAR_ESQUEMA": "true" if inicializar else "false"}
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{puerto}/", timeout=1):
+                    return time.perf_counter() - inicio
+            except (urllib.error.URLError, ConnectionError):
+                if proceso.poll() is not None:
+                    raise RuntimeError("uvicorn terminó antes de responder")
+                if time.perf_counter() - inicio > 120:
+                    raise TimeoutError("La API no respondió en 120 s")
+                time.sleep(0.02)
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--puerto", type=int, default=8099)
+    args = parser.parse_args()
+
+    tiempos, cargados = zip(*(medir_import() for _ in range(args.repeticiones)))
+    print(f"import main            mediana {statistics.median(tiempos):6.3f} s  | pesados cargados: {cargados[-1] or 'ninguno'}")
+
+    for inicializar in (False, True):
+        tiempos = [medir_arranque(args.puerto, inicializar) for _ in range(args.repeticiones)]
+        nombre = f"arranque (esquema={'sí' if inicializar else 'no'})"
+        print(f"{nombre:<22} mediana {statistics.median(tiempos):6.3f} s  | máx {max(tiempos):.3f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark: costo por celda de la clasificación de stock por color.
+
+Compara la implementación anterior (dict de objetivos + bucle de color_distance
+en cada celda) contra la clasificación memoizada por clave cruda del relleno.
+Aparte mide el costo de un fallo de la caché (un color nuevo contra la paleta):
+la versión con NumPy que se usó al principio contra el bucle en Python actual.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_colores
+    python -m benchmarks.bench_colores --filas 50000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles.colors import COLOR_INDEX
+
+from benchmarks.datos_sinteticos import rellenos_sinteticos
+from routers.archivos import interpretar_stock_por_valor_y_color, clasificar_clave_color, hex_to_rgb
+from routers.archivos import OBJETIVOS_STOCK, TOLERANCIA_COLOR, _estado_por_rgb
+
+# ==========================================
+# IMPLEMENTACIÓN ANTERIOR (REFERENCIA)
+# ==========================================
+
+def get_color_from_cell(cell):
+    try:
+        if cell.fill is None:
+            return "000000"
+        if not cell.fill or not hasattr(cell.fill, 'start_color'):
+            return None
+        sc = cell.fill.start_color
+        if sc.type == 'rgb' and sc.rgb and isinstance(sc.rgb, str):
+            color = str(sc.rgb).upper()
+            return color[-6:] if len(color) >= 6 else color
+        if sc.type == 'indexed' and sc.indexed is not None:
+            try:
+                idx_color = COLOR_INDEX[sc.indexed]
+                return str(idx_color).upper()[-6:]
+            except:
+                pass
+        if sc.type == 'theme':
+            return f"THEME_{sc.theme}"
+        return None
+    except:
+        return None
+
+def color_distance(c1, c2):
+    if not c1 or not c2: return 999
+    return sum((a - b) ** 2 for a, b in zip(c1, c2)) ** 0.5
+
+def interpretar_anterior(cell):
+    val_texto = str(cell.value).strip().upper() if cell.value else ""
+    if val_texto in ["SI", "HAY", "STOCK", "DISPONIBLE"]:
+        return "HAY STOCK", "TEXTO_SI"
+    if val_texto in ["NO", "SIN", "AGOTADO"]:
+        return "NO HAY STOCK", "TEXTO_NO"
+
+    raw_color = get_color_from_cell(cell)
+    if not raw_color:
+        return "NO DEFINIDO", "SIN_INFO"
+
+    rgb = hex_to_rgb(raw_color)
+    if not rgb:
+        if raw_color in ["THEME_5", "THEME_9"]: return "CONSULTAR", raw_color
+        if raw_color in ["THEME_4", "THEME_8"]: return "HAY STOCK", raw_color
+        if raw_color in ["THEME_6", "THEME_7"]: return "NO HAY STOCK", raw_color
+        return "DESCONOCIDO", raw_color
+
+    targets = {
+        "CONSULTAR": [(255, 255, 0), (255, 230, 0), (255, 255, 102), (255, 192, 0), (255, 255, 153)],
+        "HAY STOCK": [(0, 176, 80), (0, 255, 0), (146, 208, 80), (0, 128, 0), (0, 255, 153)],
+        "NO HAY STOCK": [(255, 0, 0), (192, 0, 0), (255, 102, 102), (255, 199, 206)]
+    }
+    TOLERANCIA = 110
+    for estado, colores_rgb in targets.items():
+        for target_rgb in colores_rgb:
+            if color_distance(rgb, target_rgb) < TOLERANCIA:
+                return estado, raw_color
+    return "DESCONOCIDO", raw_color
+
+# Fallo de la caché con NumPy (primera versión memoizada)
+_PALETA_ESTADOS = [estado for estado, colores in OBJETIVOS_STOCK.items() for _ in colores]
+_PALETA_RGB = np.array([rgb for colores in OBJETIVOS_STOCK.values() for rgb in colores], dtype=np.int64)
+
+def estado_por_rgb_numpy(rgb):
+    distancias2 = ((_PALETA_RGB - np.array(rgb, dtype=np.int64)) ** 2).sum(axis=1)
+    dentro = np.flatnonzero(distancias2 < TOLERANCIA_COLOR ** 2)
+    return _PALETA_ESTADOS[dentro[0]] if dentro.size else "DESCONOCIDO"
+
+# ==========================================
+# HOJA SINTÉTICA
+# ==========================================
+
+def generar_hoja(ruta, filas):
+    rnd = random.Random(7)
+    rellenos = rellenos_sinteticos()
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("MARCA")
+    ws.append(["CODIGO", "DESCRIPCION", "STOCK"])
+    for i in range(filas):
+        celda_stock = WriteOnlyCell(ws, value=rnd.choice([0, 5, "-", "SI", "NO"]))
+        relleno = rnd.choice(rellenos)
+        if relleno is not None:
+            celda_stock.fill = relleno
+        ws.append([f"COD{i}", "Artículo sintético", celda_stock])
+    wb.save(ruta)
+
+def celdas_stock(ruta):
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        return [row[2] for row in wb["MARCA"].iter_rows(min_row=2)]
+    finally:
+        wb.close()
+
+def medir(funcion, celdas):
+    inicio = time.perf_counter()
+    resultados = [funcion(c) for c in celdas]
+    return time.perf_counter() - inicio, resultados
+
+def medir_fallos(cantidad=100_000):
+    """µs por fallo de caché: NumPy contra el bucle en Python, sobre los mismos colores al azar."""
+    rnd = random.Random(1)
+    colores = [(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for _ in range(cantidad)]
+    tiempos = {}
+    resultados = {}
+    for nombre, funcion in (("NumPy", estado_por_rgb_numpy), ("Python", _estado_por_rgb)):
+        inicio = time.perf_counter()
+        resultados[nombre] = [funcion(c) for c in colores]
+        tiempos[nombre] = (time.perf_counter() - inicio) / cantidad * 1e6
+    assert resultados["NumPy"] == resultados["Python"], "El bucle en Python clasifica distinto que NumPy"
+    return tiempos
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, default=200_000)
+    args = parser.parse_args()
+
+    fd, ruta = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        print(f"📄 Generando hoja sintética de {args.filas} filas...")
+        generar_hoja(ruta, args.filas)
+        celdas = celdas_stock(ruta)
+
+        t_anterior, r_anterior = medir(interpretar_anterior, celdas)
+        clasificar_clave_color.cache_clear()
+        t_nuevo, r_nuevo = medir(interpretar_stock_por_valor_y_color, celdas)
+
+        assert r_anterior == r_nuevo, "La clasificación nueva difiere de la anterior"
+
+        n = len(celdas)
+        info = clasificar_clave_color.cache_info()
+        print(f"Anterior:   {t_anterior:.3f} s  ({t_anterior / n * 1e6:.2f} µs/celda)")
+        print(f"Memoizado:  {t_nuevo:.3f} s  ({t_nuevo / n * 1e6:.2f} µs/celda)")
+        print(f"Aceleración: x{t_anterior / t_nuevo:.1f}  |  rellenos distintos: {info.currsize}, hits: {info.hits}")
+        fallos = medir_fallos()
+        print(f"Fallo de caché: NumPy {fallos['NumPy']:.2f} µs  |  bucle Python {fallos['Python']:.2f} µs")
+    finally:
+        os.remove(ruta)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark: latencia de /stock/{codigo} mientras corre una subida grande.
+
+Contra un servidor ya levantado (uvicorn main:app), mide p50/p95/p99 de
+GET /stock/{codigo} primero en reposo y después mientras /upload-sheet
+procesa una carga de N filas. Con la capa async, las consultas cortas no
+deberían quedar esperando a que termine la subida.
+
+Requiere httpx (pip install httpx).
+
+Uso (desde la raíz del proyecto, con la API corriendo):
+    python -m benchmarks.bench_concurrencia --url http://127.0.0.1:8000
+    python -m benchmarks.bench_concurrencia --filas 300000 --concurrencia 20
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    idx = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[idx]
+
+def filas_stock(n, version=0):
+    return [
+        {
+            "Código": f"BENCH{i:07d}",
+            "Artículo": f"Artículo de prueba {i}",
+            "Stock": (i + version) % 50,
+            "Stock Mínimo": 5,
+            "Stock Optimo": 20,
+            "Marca": "BENCH",
+        }
+        for i in range(n)
+    ]
+
+async def consultar_en_bucle(cliente, codigos, hasta, latencias, errores):
+    while time.perf_counter() < hasta:
+        codigo = random.choice(codigos)
+        inicio = time.perf_counter()
+        try:
+            r = await cliente.get(f"/stock/{codigo}")
+            if r.status_code != 200:
+                errores.append(r.status_code)
+        except httpx.HTTPError as e:
+            errores.append(type(e).__name__)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+async def medir_lecturas(cliente, codigos, segundos, concurrencia):
+    latencias, errores = [], []
+    hasta = time.perf_counter() + segundos
+    await asyncio.gather(*[
+        consultar_en_bucle(cliente, codigos, hasta, latencias, errores) for _ in range(concurrencia)
+    ])
+    return latencias, errores
+
+def informe(nombre, latencias, errores, segundos):
+    print(
+        f"{nombre:<18} n={len(latencias):>6}  {len(latencias) / segundos:7.0f} req/s  "
+        f"p50={percentil(latencias, 50):7.1f} ms  p95={percentil(latencias, 95):7.1f} ms  "
+        f"p99={percentil(latencias, 99):7.1f} ms  max={max(latencias, default=0):7.1f} ms  errores={len(errores)}"
+    )
+
+async def main_async(args):
+    limites = httpx.Limits(max_connections=args.concurrencia + 4)
+    async with httpx.AsyncClient(base_url=args.url, timeout=600, limits=limites) as cliente:
+        print(f"📦 Preparando {args.filas} filas de stock...")
+        r = await cliente.post("/upload-sheet", json=filas_stock(args.filas))
+        r.raise_for_status()
+        codigos = [f"BENCH{i:07d}" for i in random.sample(range(args.filas), min(args.filas, 5000))]
+
+        latencias, errores = await medir_lecturas(cliente, codigos, args.segundos, args.concurrencia)
+        informe("en reposo", latencias, errores, args.segundos)
+
+        # Versión distinta de los datos para que la subida tenga trabajo real
+        payload = filas_stock(args.filas, version=int(time.time()))
+        inicio = time.perf_counter()
+        subida = asyncio.create_task(cliente.post("/upload-sheet", json=payload))
+        latencias, errores = [], []
+        while not subida.done():
+            lat, err = await medir_lecturas(cliente, codigos, 1.0, args.concurrencia)
+            latencias += lat
+            errores += err
+        duracion_subida = time.perf_counter() - inicio
+        subida.result().raise_for_status()
+        informe("durante la subida", latencias, errores, duracion_subida)
+        print(f"\nSubida de {args.filas} filas: {duracion_subida:.1f} s")
+        if latencias:
+            print(f"Latencia media durante la subida: {statistics.mean(latencias):.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--segundos", type=float, default=5.0)
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark y verificación de paridad: /procesar-inventario-completo/.
+
+Genera un inventario sintético como los de las marcas (varias hojas, STOCK pintado)
+con openpyxl en modo write_only, que no escribe el tag <dimension> de la hoja: en
+modo solo lectura las filas llegan sin sus celdas vacías del final, igual que con
+algunos exportadores de proveedores. Compara los items de la implementación anterior
+(libro completo en memoria) con los de la lectura en streaming, secuencial y
+repartida entre procesos, y falla si difieren en algo. Con otro libro sin <dimension>,
+con filas cortas y en blanco, compara también las filas de /leer-excel/ con las de su
+implementación anterior.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_inventario
+    python -m benchmarks.bench_inventario --filas 200000 --hojas 40
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from openpyxl import Workbook, load_workbook
+
+from benchmarks.bench_colores import interpretar_anterior
+from benchmarks.datos_sinteticos import generar_libro_inventario
+from routers.archivos import iterar_inventario, iterar_inventario_paralelo, iterar_filas_excel, cerrar_pool_hojas
+
+# ==========================================
+# IMPLEMENTACIÓN ANTERIOR (REFERENCIA)
+# ==========================================
+
+def inventario_anterior(ruta):
+    wb = load_workbook(ruta, data_only=True)
+    lista_consolidada = []
+    for sheet_name in wb.sheetnames:
+        ws = wb[sheet_name]
+        header_row_idx = 1
+        idx_stock = -1
+        idx_codigo = 0
+        headers = []
+
+        for r in range(1, 6):
+            row_cells = list(ws.iter_rows(min_row=r, max_row=r))[0]
+            temp_headers = [str(c.value).strip().upper() if c.value else "" for c in row_cells]
+            if "STOCK" in temp_headers or "CODIGO" in temp_headers or "CODIGOS" in temp_headers:
+                header_row_idx = r
+                headers = [h if h else f"COL_{i}" for i, h in enumerate(temp_headers)]
+                for i, h in enumerate(headers):
+                    if h == "STOCK": idx_stock = i
+                    if h in ["CODIGO", "CODIGOS"]: idx_codigo = i
+                break
+
+        if not headers:
+            headers = [str(c.value).strip().upper() if c.value else f"COL_{i}" for i, c in enumerate(ws[1])]
+            for i, h in enumerate(headers):
+                if h == "STOCK": idx_stock = i
+                if h in ["CODIGO", "CODIGOS"]: idx_codigo = i
+
+        for row in ws.iter_rows(min_row=header_row_idx + 1):
+            raw_codigo = row[idx_codigo].value
+            if raw_codigo is None or str(raw_codigo).strip() == "":
+                continue
+            item = {"ORIGEN_HOJA": sheet_name, "CODIGO": str(raw_codigo).strip()}
+            for idx, cell in enumerate(row):
+                if idx >= len(headers): break
+                item[headers[idx]] = cell.value
+                if idx == idx_stock:
+                    estado, raw_info = interpretar_anterior(cell)
+                    item["STOCK_ESTADO"] = estado
+                    item["STOCK_DETALLE"] = raw_info
+            lista_consolidada.append(item)
+    return lista_consolidada
+
+def filas_excel_anterior(ruta):
+    # /leer-excel/ aplanado a (hoja, fila), como lo genera iterar_filas_excel
+    wb = load_workbook(ruta, data_only=True)
+    filas = []
+    for sheet_name in wb.sheetnames:
+        ws = wb[sheet_name]
+        if ws.max_row < 2: continue
+        headers = [str(c.value) for c in ws[1]]
+        for row in ws.iter_rows(min_row=2):
+            fila = {}
+            for idx, cell in enumerate(row):
+                if idx >= len(headers): break
+                fila[headers[idx]] = cell.value
+            filas.append((sheet_name, fila))
+    return filas
+
+def generar_libro_filas_cortas(ruta, filas):
+    """Encabezado completo; filas a las que les faltan las últimas celdas, y algunas vacías."""
+    rnd = random.Random(5)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Articulos")
+    ws.append(["Codigo", "Desc", "Precio", "Stock"])
+    for i in range(filas):
+        fila = [f"C{i:06d}", f"Artículo {i}", round(rnd.uniform(100, 9000), 2), rnd.randrange(50)]
+        ws.append(fila[:rnd.choice([0, 1, 2, 3, 4, 4])])
+    wb.save(ruta)
+
+# ==========================================
+# MEDICIÓN
+# ==========================================
+
+def medir(funcion, ruta):
+    inicio = time.perf_counter()
+    items = list(funcion(ruta))
+    return time.perf_counter() - inicio, items
+
+def comparar(nombre, anterior, items):
+    distintos = [i for i, (a, b) in enumerate(zip(anterior, items)) if a != b]
+    assert len(anterior) == len(items), f"{nombre}: {len(items)} items, la anterior da {len(anterior)}"
+    assert not distintos, (
+        f"{nombre}: {len(distintos)} items distintos a la anterior, ej. "
+        f"{anterior[distintos[0]]} vs {items[distintos[0]]}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, default=50_000)
+    parser.add_argument("--hojas", type=int, default=20)
+    args = parser.parse_args()
+
+    fd, ruta = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    fd, ruta_filas = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        print(f"📄 Generando inventario sintético de {args.filas} filas en {args.hojas} hojas...")
+        generar_libro_inventario(ruta, args.filas, args.hojas)
+
+        t_anterior, anterior = medir(inventario_anterior, ruta)
+        t_streaming, streaming = medir(iterar_inventario, ruta)
+        t_paralelo, paralelo = medir(iterar_inventario_paralelo, ruta)
+        comparar("streaming", anterior, streaming)
+        comparar("paralelo", anterior, paralelo)
+        generar_libro_filas_cortas(ruta_filas, args.filas)
+        comparar("leer-excel", filas_excel_anterior(ruta_filas), list(iterar_filas_excel(ruta_filas)))
+
+        n = len(anterior)
+        print(f"Anterior:   {t_anterior:.3f} s  ({n / t_anterior:,.0f} items/s)")
+        print(f"Streaming:  {t_streaming:.3f} s  ({n / t_streaming:,.0f} items/s)")
+        print(f"Paralelo:   {t_paralelo:.3f} s  ({n / t_paralelo:,.0f} items/s)")
+        print(f"✅ {n} items (y las filas de /leer-excel/) idénticos a la implementación anterior")
+    finally:
+        cerrar_pool_hojas()
+        os.remove(ruta)
+        os.remove(ruta_filas)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: resolver un presupuesto de N líneas, código por código vs en lote.
+
+Contra un servidor ya levantado (uvicorn main:app), sube una lista de precios
+y un stock sintéticos y compara:
+  - bucle:  un GET /precios/{codigo} (o /stock/{codigo}) por código
+  - lote:   un único POST /precios/lookup (o /stock/lookup)
+
+Cada modo usa códigos distintos para que la caché de consultas no favorezca
+al segundo. Requiere httpx (pip install httpx).
+
+Uso (desde la raíz del proyecto, con la API corriendo):
+    python -m benchmarks.bench_lookup --url http://127.0.0.1:8000
+    python -m benchmarks.bench_lookup --lineas 2000 --articulos 100000
+"""
+import argparse
+import random
+import time
+
+import httpx
+
+PROVEEDORES = ["BENCH_A", "BENCH_B", "BENCH_C"]
+
+def cargar_datos(cliente, articulos):
+    semilla = int(time.time())
+    precios = [
+        {"Código": f"LK{i:07d}", "Artículo": f"Artículo {i}", "Proveedor": PROVEEDORES[i % 3], "C. Final": (i * 7 + semilla) % 10000}
+        for i in range(articulos)
+    ]
+    stock = [
+        {"Código": f"LK{i:07d}", "Artículo": f"Artículo {i}", "Stock": (i + semilla) % 50, "Marca": "BENCH"}
+        for i in range(articulos)
+    ]
+    cliente.post("/upload-precios", json=precios).raise_for_status()
+    cliente.post("/upload-sheet", json=stock).raise_for_status()
+
+def codigos_presupuesto(rnd, articulos, lineas):
+    # ~5% de códigos que no existen, como en un presupuesto real con errores de tipeo
+    return [
+        f"LK{rnd.randrange(articulos):07d}" if rnd.random() > 0.05 else f"NOEXISTE{rnd.randrange(10**6)}"
+        for _ in range(lineas)
+    ]
+
+def medir_bucle(cliente, ruta, codigos):
+    inicio = time.perf_counter()
+    encontrados = sum(cliente.get(f"{ruta}/{codigo}").status_code == 200 for codigo in codigos)
+    return time.perf_counter() - inicio, encontrados
+
+def medir_lote(cliente, ruta, codigos):
+    inicio = time.perf_counter()
+    r = cliente.post(f"{ruta}/lookup", json={"codigos": codigos})
+    r.raise_for_status()
+    return time.perf_counter() - inicio, len(r.json()["encontrados"])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--lineas", type=int, default=2000)
+    parser.add_argument("--articulos", type=int, default=50_000)
+    args = parser.parse_args()
+
+    rnd = random.Random(13)
+    with httpx.Client(base_url=args.url, timeout=600) as cliente:
+        print(f"📦 Subiendo {args.articulos} precios y artículos de stock...")
+        cargar_datos(cliente, args.articulos)
+
+        for ruta in ("/precios", "/stock"):
+            # Muestras distintas para bucle y lote: ninguno aprovecha la caché del otro
+            bucle = codigos_presupuesto(rnd, args.articulos, args.lineas)
+            lote = codigos_presupuesto(rnd, args.articulos, args.lineas)
+            t_bucle, n_bucle = medir_bucle(cliente, ruta, bucle)
+            t_lote, n_lote = medir_lote(cliente, ruta, lote)
+            print(f"\n{ruta}  ({args.lineas} códigos)")
+            print(f"  bucle {t_bucle:8.2f} s  | {n_bucle} encontrados")
+            print(f"  lote  {t_lote:8.2f} s  | {n_lote} encontrados  | x{t_bucle / t_lote:.0f} más rápido")
+
+if __name__ == "__main__":
+    main()
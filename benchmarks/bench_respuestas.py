@@ -0,0 +1,84 @@
+"""
+Benchmark: serialización y tamaño de las respuestas grandes.
+
+Genera un libro sintético de N filas (con fechas y números en las celdas) y
+arma las mismas respuestas que /leer-excel/ y /procesar-inventario-completo/.
+Para cada una compara:
+  - anterior: jsonable_encoder + JSONResponse (json.dumps de la librería estándar)
+  - orjson:   RespuestaJSON devuelta directamente (respuestas.py)
+y el tamaño/tiempo de comprimirla con gzip y, si está instalado, brotli
+(con los mismos niveles que usa CompresionMiddleware).
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_respuestas
+    python -m benchmarks.bench_respuestas --filas 300000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.bench_colores import generar_hoja
+from benchmarks.datos_sinteticos import generar_libro_articulos
+from compresion import _Compresor, brotli
+from respuestas import RespuestaJSON
+from routers.archivos import leer_libro, iterar_inventario
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return time.perf_counter() - inicio, resultado
+
+def serializar_anterior(contenido):
+    return JSONResponse(jsonable_encoder(contenido)).body
+
+def serializar_orjson(contenido):
+    return RespuestaJSON(contenido).body
+
+def comprimir(codificacion, cuerpo):
+    return _Compresor(codificacion).bloque(cuerpo, True)
+
+def informar(nombre, contenido):
+    t_anterior, anterior = cronometrar(serializar_anterior, contenido)
+    t_orjson, cuerpo = cronometrar(serializar_orjson, contenido)
+    assert json.loads(anterior) == json.loads(cuerpo), "orjson devuelve un JSON distinto al anterior"
+    print(f"\n{nombre}")
+    print(f"  anterior {t_anterior:7.3f} s  | {len(anterior) / 1e6:7.1f} MB")
+    print(f"  orjson   {t_orjson:7.3f} s  | {len(cuerpo) / 1e6:7.1f} MB  | x{t_anterior / t_orjson:.1f} más rápido")
+    for codificacion in (["gzip", "br"] if brotli is not None else ["gzip"]):
+        t, comprimido = cronometrar(comprimir, codificacion, cuerpo)
+        print(f"  {codificacion:<8} {t:7.3f} s  | {len(comprimido) / 1e6:7.1f} MB  | {len(cuerpo) / len(comprimido):.1f}:1")
+    if brotli is None:
+        print("  (brotli no instalado: pip install brotli)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filas", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rutas = []
+    try:
+        for _ in range(2):
+            fd, ruta = tempfile.mkstemp(suffix=".xlsx")
+            os.close(fd)
+            rutas.append(ruta)
+        ruta_articulos, ruta_inventario = rutas
+
+        print(f"📄 Generando libros sintéticos de {args.filas} filas...")
+        generar_libro_articulos(ruta_articulos, args.filas)
+        generar_hoja(ruta_inventario, args.filas)
+
+        informar("/leer-excel/", leer_libro(ruta_articulos))
+
+        items = list(iterar_inventario(ruta_inventario))
+        informar("/procesar-inventario-completo/", {"archivo": "bench.xlsx", "total_items": len(items), "datos": items})
+    finally:
+        for ruta in rutas:
+            os.remove(ruta)
+
+if __name__ == "__main__":
+    main()
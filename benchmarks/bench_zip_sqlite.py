@@ -0,0 +1,114 @@
+"""
+Benchmark: /procesar-zip-sqlite/ con un ZIP grande y muchos códigos.
+
+Genera un ZIP de proveedor con una base SQLite (tabla Articulos) y relleno
+binario (imágenes/PDFs simulados), y compara:
+  - anterior: extractall + dos consultas IN (?, ?, …) concatenadas
+  - actual:   extracción solo de la base + una consulta contra tablas temporales
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_zip_sqlite                      # 500 MB, 50k códigos
+    python -m benchmarks.bench_zip_sqlite --mb 50 --codigos 10000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+import pandas as pd
+
+from benchmarks.datos_sinteticos import generar_catalogo
+from routers.archivos import extraer_sqlite_de_zip, buscar_articulos
+
+TAMANO_RELLENO = 8 * 1024 * 1024
+
+def generar_zip(zip_path, articulos, megas):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "catalogo.sqlite")
+        generar_catalogo(db_path, articulos)
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            # Relleno sin comprimir: simula imágenes y PDFs ya comprimidos
+            escritos, i = 0, 0
+            while escritos < megas * 1024 * 1024:
+                nombre = f"imagenes/img_{i:05d}.jpg" if i % 3 else f"fichas/ficha_{i:05d}.pdf"
+                with zf.open(zipfile.ZipInfo(nombre), "w") as destino:
+                    destino.write(os.urandom(TAMANO_RELLENO))
+                escritos += TAMANO_RELLENO
+                i += 1
+            zf.write(db_path, "datos/catalogo.sqlite", compress_type=zipfile.ZIP_DEFLATED)
+
+def consulta_anterior(zip_path, temp_dir, lista_codigos, lista_codigos_prov):
+    db_path = None
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        zf.extractall(temp_dir)
+        for f in zf.namelist():
+            if f.endswith(('.sqlite', '.db', '.sqlite3')):
+                db_path = os.path.join(temp_dir, f)
+                break
+    conn = sqlite3.connect(db_path)
+    dfs = []
+    if lista_codigos:
+        p = ','.join('?' for _ in lista_codigos)
+        dfs.append(pd.read_sql_query(f"SELECT * FROM Articulos WHERE Codigo IN ({p})", conn, params=lista_codigos))
+    if lista_codigos_prov:
+        p = ','.join('?' for _ in lista_codigos_prov)
+        dfs.append(pd.read_sql_query(f"SELECT * FROM Articulos WHERE CodigoParticular IN ({p})", conn, params=lista_codigos_prov))
+    resultado = pd.concat(dfs).drop_duplicates().to_dict(orient="records") if dfs else []
+    conn.close()
+    return resultado
+
+def consulta_actual(zip_path, temp_dir, lista_codigos, lista_codigos_prov):
+    db_path = extraer_sqlite_de_zip(zip_path, os.path.join(temp_dir, "catalogo.sqlite"))
+    return buscar_articulos(db_path, lista_codigos, lista_codigos_prov)
+
+def bytes_en_disco(directorio):
+    total = 0
+    for raiz, _, archivos in os.walk(directorio):
+        total += sum(os.path.getsize(os.path.join(raiz, a)) for a in archivos)
+    return total
+
+def medir(nombre, funcion, zip_path, codigos, codigos_prov):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(zip_path, temp_dir, codigos, codigos_prov)
+            detalle = f"{len(resultado)} filas"
+        except Exception as e:
+            detalle = f"ERROR: {e}"
+        duracion = time.perf_counter() - inicio
+        escrito = bytes_en_disco(temp_dir) / 1024 / 1024
+        print(f"{nombre:<10} {duracion:8.2f} s  | {escrito:8.1f} MB escritos | {detalle}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=int, default=500, help="Tamaño aproximado del ZIP")
+    parser.add_argument("--codigos", type=int, default=50_000)
+    parser.add_argument("--articulos", type=int, default=300_000)
+    args = parser.parse_args()
+
+    rnd = random.Random(11)
+    # 80% por Codigo, 20% por CodigoParticular, con ~10% de códigos inexistentes
+    n_prov = args.codigos // 5
+    codigos = [f"A{rnd.randrange(int(args.articulos * 1.1)):07d}" for _ in range(args.codigos - n_prov)]
+    codigos_prov = [f"P{rnd.randrange(int(args.articulos * 1.1)):07d}" for _ in range(n_prov)]
+
+    fd, zip_path = tempfile.mkstemp(suffix=".zip")
+    os.close(fd)
+    try:
+        print(f"📦 Generando ZIP de ~{args.mb} MB con {args.articulos} artículos...")
+        generar_zip(zip_path, args.articulos, args.mb)
+        print(f"   {os.path.getsize(zip_path) / 1024 / 1024:.0f} MB, {len(codigos)} códigos + {len(codigos_prov)} códigos de proveedor\n")
+        medir("anterior", consulta_anterior, zip_path, codigos, codigos_prov)
+        medir("actual", consulta_actual, zip_path, codigos, codigos_prov)
+    finally:
+        os.remove(zip_path)
+
+if __name__ == "__main__":
+    main()
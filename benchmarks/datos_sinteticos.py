@@ -0,0 +1,156 @@
+"""
+Datos sintéticos para los benchmarks: libros con estilos, ZIPs de proveedor y
+cargas JSON de precios/stock. Todo es determinístico (semillas fijas), así dos
+corridas del mismo tamaño procesan exactamente los mismos datos.
+"""
+import datetime
+import gzip
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import zipfile
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill
+from openpyxl.styles.colors import Color
+
+# Todos los códigos sintéticos empiezan así (bench_e2e los borra al terminar)
+PREFIJO = "E2E"
+PROVEEDORES = ["BENCH_A", "BENCH_B", "BENCH_C"]
+MARCAS = ["BOSCH", "SKF", "VW", "FRAM", "FIAT", "FORD"]
+
+def codigo(i: int) -> str:
+    return f"{PREFIJO}{i:07d}"
+
+# ==========================================
+# LIBROS DE EXCEL
+# ==========================================
+
+def rellenos_sinteticos(cantidad_rgb=30):
+    """Rellenos variados: RGB al azar, los colores base de la paleta, indexados y de tema."""
+    rnd = random.Random(42)
+    rellenos = [None]
+    for _ in range(cantidad_rgb):
+        rgb = "FF%02X%02X%02X" % (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+        rellenos.append(PatternFill("solid", start_color=rgb))
+    for base in ("FF00B050", "FFFF0000", "FFFFFF00", "FF92D050"):
+        rellenos.append(PatternFill("solid", start_color=base))
+    for idx in (2, 3, 5, 10, 13):
+        rellenos.append(PatternFill("solid", start_color=Color(indexed=idx)))
+    for tema in range(4, 10):
+        rellenos.append(PatternFill("solid", start_color=Color(theme=tema)))
+    return rellenos
+
+def generar_libro_inventario(ruta, filas, hojas=20):
+    """
+    Inventario como los de las marcas: una hoja por marca, un título antes del
+    encabezado y la columna STOCK pintada (o con SI/NO escrito).
+    """
+    rnd = random.Random(7)
+    rellenos = rellenos_sinteticos()
+    wb = Workbook(write_only=True)
+    por_hoja = -(-filas // hojas)
+    for h in range(hojas):
+        ws = wb.create_sheet(f"MARCA {h:02d}")
+        ws.append([f"LISTA DE STOCK - MARCA {h:02d}"])
+        ws.append(["CODIGO", "DESCRIPCION", "PRECIO", "STOCK"])
+        for i in range(h * por_hoja, min(filas, (h + 1) * por_hoja)):
+            celda_stock = WriteOnlyCell(ws, value=rnd.choice([0, 5, "-", "SI", "NO", None]))
+            relleno = rnd.choice(rellenos)
+            if relleno is not None:
+                celda_stock.fill = relleno
+            ws.append([codigo(i), f"Artículo sintético {i}", round(rnd.uniform(100, 90000), 2), celda_stock])
+    wb.save(ruta)
+
+def generar_libro_articulos(ruta, filas):
+    """Hoja "Articulos" con texto, enteros, decimales y fechas (lo que lee /leer-excel/)."""
+    rnd = random.Random(3)
+    base = datetime.datetime(2024, 1, 1, 8, 30)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Articulos")
+    ws.append(["Código", "Artículo", "Marca", "Stock", "C. Final", "Actualizado"])
+    for i in range(filas):
+        ws.append([
+            codigo(i), f"Artículo sintético {i}", rnd.choice(MARCAS),
+            rnd.randrange(100), round(rnd.uniform(100, 90000), 2), base + datetime.timedelta(minutes=i),
+        ])
+    wb.save(ruta)
+
+# ==========================================
+# ZIP DE PROVEEDOR CON BASE SQLITE
+# ==========================================
+
+def generar_catalogo(db_path, articulos):
+    """Base SQLite con la tabla Articulos que traen los ZIPs de los proveedores."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE Articulos (
+            Codigo TEXT, CodigoParticular TEXT, Descripcion TEXT, Marca TEXT, Precio REAL
+        )
+    """)
+    rnd = random.Random(3)
+    conn.executemany(
+        "INSERT INTO Articulos VALUES (?, ?, ?, ?, ?)",
+        (
+            (f"A{i:07d}", f"P{i:07d}", f"Artículo sintético {i}", rnd.choice(["VW", "FIAT", "FORD"]), rnd.uniform(100, 90000))
+            for i in range(articulos)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+def generar_zip_proveedor(zip_path, articulos, imagenes=20, tamano_imagen=256 * 1024):
+    """ZIP con la base en una subcarpeta y algunas "imágenes" (bytes al azar, no comprimibles)."""
+    rnd = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "catalogo.sqlite")
+        generar_catalogo(db_path, articulos)
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            for i in range(imagenes):
+                zf.writestr(f"imagenes/img_{i:05d}.jpg", rnd.randbytes(tamano_imagen))
+            zf.write(db_path, "datos/catalogo.sqlite", compress_type=zipfile.ZIP_DEFLATED)
+
+# ==========================================
+# CARGAS JSON DE PRECIOS Y STOCK
+# ==========================================
+
+def filas_precios(n, version=0):
+    """Filas como las manda Sheets a /upload-precios. Cambiar `version` cambia todos los precios."""
+    rnd = random.Random(version)
+    return [
+        {
+            "Código": codigo(i),
+            "Artículo": f"Artículo sintético {i}",
+            "Proveedor": PROVEEDORES[i % len(PROVEEDORES)],
+            "C. Final": round(rnd.uniform(100, 90000), 2),
+            "Marca": MARCAS[i % len(MARCAS)],
+            "Cod. Art. P.": f"P{i:07d}",
+            "Rubro": f"RUBRO {i % 40}",
+        }
+        for i in range(n)
+    ]
+
+def filas_stock(n, version=0):
+    """Filas como las manda Sheets a /upload-sheet. Cambiar `version` cambia todos los stocks."""
+    return [
+        {
+            "Código": codigo(i),
+            "Artículo": f"Artículo sintético {i}",
+            "Stock": (i + version) % 50,
+            "Stock Mínimo": 5,
+            "Stock Optimo": 20,
+            "Marca": MARCAS[i % len(MARCAS)],
+        }
+        for i in range(n)
+    ]
+
+def a_columnar(filas) -> dict:
+    """Mismas filas en el formato de los endpoints /columnar."""
+    columnas = list(filas[0]) if filas else []
+    return {"columnas": columnas, "filas": [[fila.get(c) for c in columnas] for fila in filas]}
+
+def json_gzip(datos) -> bytes:
+    return gzip.compress(json.dumps(datos, ensure_ascii=False).encode("utf-8"), compresslevel=5)
@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+import asyncpg
+from sqlalchemy import text
+from metricas import Contador
+
+# Canal de Postgres por el que las subidas avisan a todos los workers que cambiaron los datos
+CANAL_INVALIDACION = "eliggi_datos_cambiados"
+
+CACHE_CONSULTAS_MAX = int(os.getenv("CACHE_CONSULTAS_MAX", "10000"))   # entradas por tabla (0 = sin caché)
+CACHE_CONSULTAS_TTL = float(os.getenv("CACHE_CONSULTAS_TTL", "300"))   # segundos; red de seguridad si se pierde un aviso
+
+# Espera entre reintentos cuando se cae la conexión que escucha los avisos
+ESPERA_RECONEXION = 5
+
+FALTA = object()
+
+class CacheConsultas:
+    """
+    LRU acotado con vencimiento por TTL para resultados de consultas puntuales.
+
+    Cada caché tiene un número de versión de los datos: `invalidar()` lo incrementa
+    y vacía las entradas. Una consulta lenta que empezó antes de una invalidación
+    no guarda su resultado (ver `version` en `guardar`), así no queda un valor
+    viejo pegado después de una subida. Se usa solo desde el event loop (sin locks).
+    """
+
+    def __init__(self, nombre: str, max_entradas: int = CACHE_CONSULTAS_MAX, ttl: float = CACHE_CONSULTAS_TTL):
+        self.nombre = nombre
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.version = 0
+        self._entradas = OrderedDict()
+        self.aciertos = Contador(f"cache_{nombre}_aciertos_total", f"Consultas de {nombre} respondidas desde memoria")
+        self.fallos = Contador(f"cache_{nombre}_fallos_total", f"Consultas de {nombre} que fueron a Postgres")
+        self.desalojos = Contador(f"cache_{nombre}_desalojos_total", f"Entradas de {nombre} desalojadas por tamaño")
+        self.invalidaciones = Contador(f"cache_{nombre}_invalidaciones_total", f"Invalidaciones de {nombre} por subidas")
+
+    @property
+    def activa(self) -> bool:
+        # Sin el listener, otro worker podría cambiar los datos sin que nos enteremos
+        return self.max_entradas > 0 and escuchando_avisos
+
+    def obtener(self, clave):
+        if not self.activa:
+            return FALTA
+        entrada = self._entradas.get(clave)
+        if entrada is None or entrada[0] < time.monotonic():
+            if entrada is not None:
+                del self._entradas[clave]
+            self.fallos.incrementar()
+            return FALTA
+        self._entradas.move_to_end(clave)
+        self.aciertos.incrementar()
+        return entrada[1]
+
+    def guardar(self, clave, valor, version: int):
+        """`version` es la que tenía la caché antes de consultar la base."""
+        if not self.activa or version != self.version:
+            return
+        self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.desalojos.incrementar()
+
+    def invalidar(self):
+        self.version += 1
+        self._entradas.clear()
+        self.invalidaciones.incrementar()
+
+    def estadisticas(self):
+        aciertos, fallos = self.aciertos.valor, self.fallos.valor
+        return {
+            "activa": self.activa,
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl,
+            "version": self.version,
+            "aciertos": aciertos,
+            "fallos": fallos,
+            "tasa_aciertos": round(aciertos / (aciertos + fallos), 4) if aciertos + fallos else None,
+            "desalojos": self.desalojos.valor,
+            "invalidaciones": self.invalidaciones.valor,
+        }
+
+# Una caché por tabla; el nombre es también el payload del NOTIFY
+cache_stock = CacheConsultas("stock")
+cache_precios = CacheConsultas("precios")
+cache_catalogo = CacheConsultas("catalogo")   # páginas de GET /catalogo
+CACHES = {c.nombre: c for c in (cache_stock, cache_precios, cache_catalogo)}
+
+escuchando_avisos = False
+
+def invalidar_todo():
+    for cache in CACHES.values():
+        cache.invalidar()
+
+def _al_recibir_aviso(conexion, pid, canal, payload):
+    cache = CACHES.get(payload)
+    if cache is not None:
+        cache.invalidar()
+    else:
+        invalidar_todo()
+
+async def avisar_cambio(db, nombre: str):
+    """
+    Encola el aviso en la transacción de la subida: Postgres lo entrega a todos los
+    workers (incluido este) recién cuando hace commit, y no lo envía si hay rollback.
+    """
+    await db.execute(text("SELECT pg_notify(:canal, :nombre)"), {"canal": CANAL_INVALIDACION, "nombre": nombre})
+
+async def escuchar_invalidaciones(url):
+    """
+    Tarea de fondo (una por worker): mantiene una conexión dedicada con LISTEN.
+    Mientras no está conectada la caché queda desactivada, y al (re)conectar se
+    vacía entera porque pudimos perder avisos en el medio.
+    """
+    global escuchando_avisos
+    dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+    while True:
+        conexion = None
+        try:
+            conexion = await asyncpg.connect(dsn)
+            perdida = asyncio.Event()
+            conexion.add_termination_listener(lambda c: perdida.set())
+            await conexion.add_listener(CANAL_INVALIDACION, _al_recibir_aviso)
+            invalidar_todo()
+            escuchando_avisos = True
+            print(f"📡 Escuchando invalidaciones de caché en '{CANAL_INVALIDACION}'.")
+            await perdida.wait()
+            print("⚠️ Se perdió la conexión de avisos de caché; reintentando...")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ No se pudo escuchar avisos de caché: {e}")
+        finally:
+            escuchando_avisos = False
+            invalidar_todo()
+            if conexion is not None and not conexion.is_closed():
+                await conexion.close()
+        await asyncio.sleep(ESPERA_RECONEXION)
+
+def estadisticas_caches():
+    return {
+        "escuchando_avisos": escuchando_avisos,
+        **{nombre: cache.estadisticas() for nombre, cache in CACHES.items()},
+    }
@@ -0,0 +1,78 @@
+import os
+import time
+import tempfile
+import threading
+
+# Archivos .tmp huérfanos (de un proceso que murió a mitad de escritura) se borran después de esto
+ANTIGUEDAD_MAX_TEMPORALES = 3600
+
+class CacheDisco:
+    """
+    Directorio de archivos direccionados por clave (ej: SHA-256 del contenido)
+    con desalojo LRU por tamaño total. El "último uso" es el mtime del archivo,
+    así que el orden sobrevive a reinicios y se comparte entre workers.
+    """
+
+    def __init__(self, directorio: str, max_bytes: int, sufijo: str):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.sufijo = sufijo
+        self._lock = threading.Lock()
+
+    def ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, clave + self.sufijo)
+
+    def obtener(self, clave: str):
+        """Ruta de la entrada si existe (y la marca como recién usada), o None."""
+        ruta = self.ruta(clave)
+        try:
+            os.utime(ruta)
+        except FileNotFoundError:
+            return None
+        return ruta
+
+    def archivo_temporal(self) -> str:
+        """Temporal dentro del mismo directorio, para poder publicarlo con un rename atómico."""
+        os.makedirs(self.directorio, exist_ok=True)
+        fd, ruta = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        os.close(fd)
+        return ruta
+
+    def guardar(self, clave: str, ruta_temporal: str) -> str:
+        destino = self.ruta(clave)
+        os.replace(ruta_temporal, destino)
+        self.desalojar(conservar=destino)
+        return destino
+
+    def desalojar(self, conservar=None):
+        """Borra las entradas menos usadas hasta quedar dentro de max_bytes."""
+        with self._lock:
+            entradas = []
+            ahora = time.time()
+            for nombre in os.listdir(self.directorio):
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    st = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                if nombre.endswith(".tmp"):
+                    if ahora - st.st_mtime > ANTIGUEDAD_MAX_TEMPORALES:
+                        _borrar(ruta)
+                    continue
+                if nombre.endswith(self.sufijo):
+                    entradas.append((st.st_mtime, st.st_size, ruta))
+
+            total = sum(tamano for _, tamano, _ in entradas)
+            for _, tamano, ruta in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                if ruta == conservar:
+                    continue
+                _borrar(ruta)
+                total -= tamano
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
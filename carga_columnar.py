@@ -0,0 +1,125 @@
+import gzip
+import orjson
+import asyncio
+from typing import TYPE_CHECKING
+from fastapi import HTTPException, Request
+
+if TYPE_CHECKING:
+    # pandas/numpy se importan recién con la primera carga columnar (ver armar_dataframe)
+    import numpy as np
+    import pandas as pd
+
+# Errores que se devuelven en el 422 (el resto solo se cuenta)
+MAX_ERRORES_INFORMADOS = 50
+
+# ==========================================
+# LECTURA DEL CUERPO: {"columnas": [...], "filas": [[...], ...]}
+# ==========================================
+
+def _decodificar(cuerpo: bytes):
+    # Con Content-Encoding: gzip ya llega descomprimido (DescompresionMiddleware);
+    # esto cubre a los clientes que mandan el .gz sin esa cabecera
+    if cuerpo[:2] == b"\x1f\x8b":
+        cuerpo = gzip.decompress(cuerpo)
+    return orjson.loads(cuerpo)
+
+async def leer_cuerpo_columnar(request: Request):
+    """
+    Lee el formato columnar (nombres de columna una sola vez y cada fila como lista),
+    opcionalmente comprimido con gzip. Devuelve (columnas, filas).
+    """
+    cuerpo = await request.body()
+    try:
+        # Descomprimir y parsear 300k filas es CPU puro: fuera del event loop
+        datos = await asyncio.to_thread(_decodificar, cuerpo)
+    except (OSError, EOFError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Cuerpo columnar inválido: {e}")
+
+    if not isinstance(datos, dict) or not isinstance(datos.get("columnas"), list) or not isinstance(datos.get("filas"), list):
+        raise HTTPException(status_code=400, detail='Se espera {"columnas": [...], "filas": [[...], ...]}')
+    columnas, filas = datos["columnas"], datos["filas"]
+    if len(set(columnas)) != len(columnas):
+        raise HTTPException(status_code=400, detail="Hay columnas repetidas")
+    for i, fila in enumerate(filas):
+        if not isinstance(fila, list) or len(fila) != len(columnas):
+            raise HTTPException(status_code=400, detail=f"La fila {i} no tiene {len(columnas)} valores")
+    return columnas, filas
+
+# ==========================================
+# VALIDACIÓN EN BLOQUE (MISMAS REGLAS QUE LOS MODELOS PYDANTIC)
+# ==========================================
+
+class ErroresColumnar:
+    """Junta los errores de todas las columnas y los informa juntos, como un 422 de Pydantic."""
+
+    def __init__(self):
+        self.detalle = []
+        self.total = 0
+
+    def agregar(self, filas_con_error, columna: str, mensaje: str):
+        """`filas_con_error`: números de fila (el índice del DataFrame)."""
+        for i in filas_con_error:
+            self.total += 1
+            if len(self.detalle) < MAX_ERRORES_INFORMADOS:
+                self.detalle.append({"loc": ["body", "filas", int(i), columna], "msg": mensaje})
+
+    def lanzar_si_hay(self):
+        if self.total:
+            raise HTTPException(status_code=422, detail={"errores": self.total, "detalle": self.detalle})
+
+def armar_dataframe(columnas, filas, campos: dict) -> "pd.DataFrame":
+    """
+    DataFrame (dtype object, valores tal cual llegaron) con una columna por campo del
+    modelo presente en la carga. `campos` mapea nombre de campo -> nombres aceptados
+    en orden de preferencia (primero el alias, como Pydantic). Las columnas
+    desconocidas se ignoran, igual que los campos extra en Pydantic.
+    """
+    import pandas as pd
+    df = pd.DataFrame(filas, columns=columnas, dtype=object)
+    elegidas = {}
+    for campo, nombres in campos.items():
+        nombre = next((n for n in nombres if n in df.columns), None)
+        if nombre is not None:
+            elegidas[nombre] = campo
+    return df[list(elegidas)].rename(columns=elegidas)
+
+def campos_de_modelo(modelo, por_nombre: bool = False) -> dict:
+    """Nombres aceptados por cada campo de un modelo Pydantic (alias y, si corresponde, el nombre)."""
+    return {
+        nombre: ((campo.alias, nombre) if por_nombre else (campo.alias,)) if campo.alias else (nombre,)
+        for nombre, campo in modelo.model_fields.items()
+    }
+
+def _es_instancia(serie: "pd.Series", tipos) -> "np.ndarray":
+    return serie.map(lambda v: isinstance(v, tipos)).to_numpy(dtype=bool)
+
+def a_float(serie: "pd.Series", errores: ErroresColumnar, columna: str) -> "np.ndarray":
+    """
+    Conversión a float con las reglas laxas de Pydantic: números y bool directo, texto
+    como lo leería float() (" 5 ", "1e3", "inf"), None u otros tipos son error.
+    """
+    import numpy as np
+    import pandas as pd
+    valores = pd.to_numeric(serie.where(~_es_instancia(serie, (list, dict)), None), errors="coerce").to_numpy(dtype=float, copy=True)
+    # Lo que pandas no pudo convertir (o quedó NaN) se resuelve valor por valor: casi nunca pasa
+    pendientes = np.flatnonzero(np.isnan(valores))
+    malos = []
+    for i in pendientes:
+        v = serie.iat[i]
+        if v is None or isinstance(v, (list, dict)):
+            malos.append(i)
+            continue
+        try:
+            convertido = float(v)
+        except (TypeError, ValueError):
+            malos.append(i)
+            continue
+        valores[i] = convertido
+    errores.agregar(serie.index[malos], columna, "Input should be a valid number")
+    return valores
+
+def texto_opcional(serie: "pd.Series", errores: ErroresColumnar, columna: str) -> list:
+    """Optional[str]: solo texto o null (Pydantic v2 no convierte números a texto)."""
+    validos = _es_instancia(serie, (str, type(None)))
+    errores.agregar(serie.index[~validos], columna, "Input should be a valid string")
+    return serie.tolist()
@@ -0,0 +1,161 @@
+import os
+import asyncio
+import hashlib
+from typing import Dict, List
+from sqlalchemy import Table, text, select, or_, table, column
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+from metricas import Contador
+
+# Filas por cada COPY hacia la tabla temporal (todas dentro de la misma transacción)
+FILAS_POR_COPY = 50_000
+
+# Intentos de una carga completa ante errores transitorios (ver con_reintentos)
+REINTENTOS_CARGA = int(os.getenv("REINTENTOS_CARGA", "3"))
+# serialization_failure y deadlock_detected: la misma transacción puede salir bien al repetirla
+_SQLSTATE_TRANSITORIOS = {"40001", "40P01"}
+
+reintentos_carga = Contador("carga_reintentos_total", "Cargas masivas repetidas por un error transitorio de la base")
+
+async def upsert_con_copy(db, tabla: Table, columnas: List[str], claves: List[str], filas: List[tuple], progreso=None) -> int:
+    """
+    Carga `filas` (tuplas en el orden de `columnas`) con COPY en una tabla temporal
+    y las fusiona en `tabla` con un único INSERT … SELECT … ON CONFLICT.
+
+    No hace commit: todo queda en la transacción abierta de `db`, así que los lectores
+    ven la lista vieja o la nueva, nunca una mitad. Las filas idénticas a las existentes
+    no se reescriben. Devuelve la cantidad de filas insertadas o modificadas.
+    Las filas no deben repetir `claves` (ON CONFLICT no admite tocar dos veces la misma fila).
+    `progreso(etapa, filas_copiadas)` se llama después de cada lote de COPY y antes del merge.
+    """
+    staging = f"staging_{tabla.name}"
+    dialecto = postgresql.dialect()
+    definicion = ", ".join(f"{c} {tabla.c[c].type.compile(dialect=dialecto)}" for c in columnas)
+    await db.execute(text(f"CREATE TEMP TABLE {staging} ({definicion}) ON COMMIT DROP"))
+
+    # COPY binario por la conexión asyncpg de la misma sesión (misma transacción)
+    conexion = await db.connection()
+    asyncpg_conn = (await conexion.get_raw_connection()).driver_connection
+    for i in range(0, len(filas), FILAS_POR_COPY):
+        await asyncpg_conn.copy_records_to_table(
+            staging, records=filas[i : i + FILAS_POR_COPY], columns=columnas
+        )
+        if progreso:
+            progreso("cargando", min(i + FILAS_POR_COPY, len(filas)))
+
+    origen = table(staging, *[column(c) for c in columnas])
+    stmt = insert(tabla).from_select(columnas, select(*[origen.c[c] for c in columnas]))
+    actualizables = [c for c in columnas if c not in claves]
+    if progreso:
+        progreso("fusionando", len(filas))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=claves,
+        set_={c: stmt.excluded[c] for c in actualizables},
+        where=or_(*[tabla.c[c].is_distinct_from(stmt.excluded[c]) for c in actualizables]),
+    )
+    return (await db.execute(stmt)).rowcount
+
+# ==========================================
+# SINCRONIZACIÓN POR DIFERENCIAS (HUELLAS)
+# ==========================================
+
+_SIN_FILA = object()
+
+def huella(valores: tuple) -> str:
+    """Huella del contenido de una fila (solo columnas no clave, ya normalizadas)."""
+    return hashlib.blake2b(repr(valores).encode("utf-8"), digest_size=16).hexdigest()
+
+def _filas_a_cargar(columnas, claves, filas, existentes):
+    """Clasifica las filas contra las huellas existentes (CPU puro, corre en un hilo)."""
+    idx_claves = [columnas.index(c) for c in claves]
+    idx_valores = [i for i, c in enumerate(columnas) if c not in claves]
+
+    a_cargar = []
+    insertados = actualizados = 0
+    for fila in filas:
+        h = huella(tuple(fila[i] for i in idx_valores))
+        previa = existentes.get(tuple(fila[i] for i in idx_claves), _SIN_FILA)
+        if previa is _SIN_FILA:
+            insertados += 1
+        elif previa != h:
+            actualizados += 1
+        else:
+            continue
+        a_cargar.append(fila + (h,))
+    return a_cargar, insertados, actualizados
+
+async def sincronizar_con_huellas(db, tabla: Table, columnas: List[str], claves: List[str], filas: List[tuple], filtro_existentes, progreso=None) -> Dict[str, int]:
+    """
+    Compara la huella de cada fila con la guardada en `tabla.c.huella` y carga con
+    COPY solo las filas nuevas o cambiadas (ver upsert_con_copy).
+    `filtro_existentes` acota qué filas de la tabla hay que leer para comparar.
+
+    Toma un advisory lock por tabla durante la transacción para que dos subidas
+    simultáneas no comparen contra huellas que la otra está por cambiar.
+    Devuelve los conteos y, en "claves_cambiadas", las claves (tuplas) de las
+    filas insertadas o modificadas.
+    `progreso(etapa, procesadas, total)` informa el avance en filas (ver cola_trabajos.Trabajo).
+    """
+    total = len(filas)
+    if progreso:
+        progreso("comparando", 0, total)
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:tabla))"), {"tabla": tabla.name})
+
+    consulta = select(*[tabla.c[c] for c in claves], tabla.c.huella).where(filtro_existentes)
+    existentes = {tuple(r[:-1]): r[-1] for r in await db.execute(consulta)}
+
+    a_cargar, insertados, actualizados = await asyncio.to_thread(
+        _filas_a_cargar, columnas, claves, filas, existentes
+    )
+
+    # Las filas sin cambios ya cuentan como procesadas
+    sin_cambios = total - len(a_cargar)
+    if progreso:
+        progreso("cargando", sin_cambios, total)
+    if a_cargar:
+        avance = (lambda etapa, n: progreso(etapa, sin_cambios + n, total)) if progreso else None
+        await upsert_con_copy(db, tabla, columnas + ["huella"], claves, a_cargar, avance)
+
+    idx_claves = [columnas.index(c) for c in claves]
+    return {
+        "insertados": insertados,
+        "actualizados": actualizados,
+        "sin_cambios": sin_cambios,
+        "claves_cambiadas": [tuple(fila[i] for i in idx_claves) for fila in a_cargar],
+    }
+
+# ==========================================
+# REINTENTOS ANTE ERRORES TRANSITORIOS
+# ==========================================
+
+def es_transitorio(error: Exception) -> bool:
+    """Conexión perdida, deadlock o conflicto de serialización: repetir la transacción puede andar."""
+    if not isinstance(error, DBAPIError):
+        return False
+    if error.connection_invalidated:
+        return True
+    return getattr(error.orig, "sqlstate", None) in _SQLSTATE_TRANSITORIOS
+
+async def con_reintentos(db, transaccion, nombre: str, intentos: int = REINTENTOS_CARGA):
+    """
+    Corre `transaccion()` (una corrutina que termina en commit) y, si falla por un
+    error transitorio, hace rollback y la repite entera con una espera creciente.
+    Se repite la carga completa y no un lote suelto: todo va en una sola transacción,
+    y la comparación por huellas hace que repetirla no duplique nada.
+    """
+    for intento in range(1, intentos + 1):
+        try:
+            return await transaccion()
+        except Exception as e:
+            try:
+                await db.rollback()
+            except Exception as error_rollback:
+                # Con la conexión caída el rollback también puede fallar: lo que importa es el error original
+                print(f"⚠️ [{nombre}] No se pudo hacer rollback: {error_rollback}")
+            if intento == intentos or not es_transitorio(e):
+                raise
+            reintentos_carga.incrementar()
+            espera = 0.5 * 2 ** (intento - 1)
+            print(f"🔁 [{nombre}] Error transitorio en la carga ({e.__class__.__name__}), reintento {intento}/{intentos - 1} en {espera:.1f}s.")
+            await asyncio.sleep(espera)
@@ -0,0 +1,326 @@
+import os
+import json
+import math
+import time
+import uuid
+import sqlite3
+import asyncio
+from fastapi.responses import JSONResponse
+from starlette.exceptions import HTTPException
+from respuestas import a_json
+from admision import RETRY_AFTER_INICIAL
+from metricas import Contador, Indicador
+
+# Estado de los trabajos en segundo plano: SQLite local, compartido por los workers
+# del mismo servidor y persistente entre reinicios.
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+TRABAJOS_DB = os.getenv("TRABAJOS_DB", os.path.join(CACHE_DIR, "trabajos.sqlite"))
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(TRABAJOS_DB) or ".", "resultados_trabajos")
+
+TRABAJOS_CONCURRENTES = int(os.getenv("TRABAJOS_CONCURRENTES", "2"))   # por worker; el resto espera en cola
+# Trabajos esperando turno por worker: cada uno retiene sus filas o su archivo subido; con la cola llena, 429
+TRABAJOS_COLA_MAX = int(os.getenv("TRABAJOS_COLA_MAX", "4"))
+TRABAJOS_RETENCION_HORAS = float(os.getenv("TRABAJOS_RETENCION_HORAS", "24"))
+
+# Como mucho una escritura de progreso por trabajo en este intervalo (segundos)
+INTERVALO_PROGRESO = 1.0
+# Cada worker marca sus trabajos activos con un latido; sin latido por este tiempo, el trabajo se da por perdido
+INTERVALO_LATIDO = 10
+LATIDO_VENCIDO = 60
+
+ESTADOS_ACTIVOS = ("en_cola", "procesando")
+
+# Identifica a este proceso en la tabla (el PID puede repetirse tras un reinicio del contenedor)
+INSTANCIA = uuid.uuid4().hex
+
+_semaforo = None
+_tareas = set()
+_esperando = set()          # ids encolados en este worker que todavía no empezaron
+_duracion_media = None
+
+rechazos = Contador("trabajos_rechazados_total", "Subidas ?modo=async rechazadas con 429 (cola de trabajos llena)")
+Indicador("trabajos_en_cola", "Trabajos en segundo plano esperando turno en este worker", lambda: len(_esperando))
+
+def _conectar():
+    conn = sqlite3.connect(TRABAJOS_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _ejecutar_sql(sql, parametros=()):
+    conn = _conectar()
+    try:
+        with conn:
+            return conn.execute(sql, parametros).rowcount
+    finally:
+        conn.close()
+
+def inicializar():
+    """Crea la tabla, marca como interrumpidos los trabajos huérfanos y borra los viejos."""
+    os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+    conn = _conectar()
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    instancia TEXT,
+                    creado REAL NOT NULL,
+                    iniciado REAL,
+                    terminado REAL,
+                    latido REAL,
+                    etapa TEXT,
+                    procesadas INTEGER DEFAULT 0,
+                    total INTEGER,
+                    unidad TEXT DEFAULT 'filas',
+                    actualizado REAL,
+                    resultado TEXT,
+                    error TEXT
+                )
+            """)
+    finally:
+        conn.close()
+    _marcar_huerfanos()
+    _purgar_viejos()
+
+ERROR_HUERFANO = "El worker que lo procesaba se detuvo; volvé a enviar la subida."
+
+def _marcar_huerfanos():
+    # Al arrancar y en cada latido (no en cada consulta: obtener() ya los muestra como interrumpidos)
+    _ejecutar_sql(
+        f"UPDATE trabajos SET estado = 'interrumpido', terminado = ?, error = ? "
+        f"WHERE estado IN {ESTADOS_ACTIVOS} AND latido < ?",
+        (time.time(), ERROR_HUERFANO, time.time() - LATIDO_VENCIDO),
+    )
+
+def _purgar_viejos():
+    limite = time.time() - TRABAJOS_RETENCION_HORAS * 3600
+    conn = _conectar()
+    try:
+        with conn:
+            viejos = [r["id"] for r in conn.execute(
+                f"SELECT id FROM trabajos WHERE estado NOT IN {ESTADOS_ACTIVOS} AND terminado < ?", (limite,)
+            )]
+            conn.executemany("DELETE FROM trabajos WHERE id = ?", [(i,) for i in viejos])
+    finally:
+        conn.close()
+    for id_trabajo in viejos:
+        try:
+            os.remove(ruta_resultado(id_trabajo))
+        except FileNotFoundError:
+            pass
+
+def ruta_resultado(id_trabajo: str) -> str:
+    return os.path.join(DIRECTORIO_RESULTADOS, f"{id_trabajo}.json")
+
+_SQL_PROGRESO = (
+    "UPDATE trabajos SET etapa = ?, procesadas = ?, total = ?, unidad = ?, actualizado = ?, latido = ? WHERE id = ?"
+)
+
+class Trabajo:
+    """Lo recibe la función del trabajo para informar avance y guardar resultados grandes."""
+
+    def __init__(self, id_trabajo: str):
+        self.id = id_trabajo
+        self._ultima_escritura = 0.0
+        self._ultima_etapa = None
+        self._pendiente = None      # último avance sin escribir (llamadas desde el event loop)
+        self._escritor = None
+
+    def progreso(self, etapa: str, procesadas: int, total: int = None, unidad: str = "filas"):
+        # Se puede llamar muy seguido (y desde otros hilos): solo se escribe cada INTERVALO_PROGRESO
+        # o cuando cambia la etapa
+        ahora = time.time()
+        if etapa == self._ultima_etapa and ahora - self._ultima_escritura < INTERVALO_PROGRESO:
+            return
+        self._ultima_escritura = ahora
+        self._ultima_etapa = etapa
+        parametros = (etapa, procesadas, total, unidad, ahora, ahora, self.id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Desde un hilo (ej: lectura del libro): escribir acá no frena al event loop
+            _ejecutar_sql(_SQL_PROGRESO, parametros)
+            return
+        # Desde el event loop (ej: sincronizar_con_huellas) la escritura va a un hilo.
+        # Una sola a la vez y siempre la más reciente, así no se pisan fuera de orden.
+        self._pendiente = parametros
+        if self._escritor is None or self._escritor.done():
+            self._escritor = loop.create_task(self._escribir_pendientes())
+
+    async def _escribir_pendientes(self):
+        while self._pendiente is not None:
+            parametros, self._pendiente = self._pendiente, None
+            try:
+                await asyncio.to_thread(_ejecutar_sql, _SQL_PROGRESO, parametros)
+            except sqlite3.Error as e:
+                print(f"⚠️ [TRABAJO {self.id}] No se pudo guardar el avance: {e}")
+
+    async def esperar_escrituras(self):
+        """Antes del estado final: que un avance atrasado no lo pise."""
+        if self._escritor is not None:
+            await self._escritor
+
+    def guardar_datos(self, datos):
+        """Resultado voluminoso (ej: items de un inventario): va a un archivo, no a la tabla."""
+        with open(ruta_resultado(self.id), "wb") as f:
+            f.write(a_json(datos))
+
+def retry_after() -> int:
+    """Segundos sugeridos para reintentar: lo que tardaría en vaciarse la cola actual."""
+    if _duracion_media is None:
+        return RETRY_AFTER_INICIAL
+    tandas = (len(_esperando) + 1) / max(TRABAJOS_CONCURRENTES, 1)
+    return max(1, math.ceil(_duracion_media * tandas))
+
+async def encolar(tipo: str, funcion, *args) -> str:
+    """
+    Registra el trabajo y lo lanza en segundo plano. `funcion(trabajo, *args)` es
+    una corrutina cuyo valor de retorno (JSON) queda como resultado del trabajo.
+    Con TRABAJOS_COLA_MAX trabajos esperando lanza HTTPException 429 con Retry-After.
+    """
+    if len(_esperando) >= TRABAJOS_COLA_MAX:
+        rechazos.incrementar()
+        raise HTTPException(
+            status_code=429,
+            detail="Hay demasiados trabajos en cola, reintentá en unos segundos",
+            headers={"Retry-After": str(retry_after())},
+        )
+    id_trabajo = uuid.uuid4().hex
+    ahora = time.time()
+    # Reservado antes de esperar el INSERT: dos subidas simultáneas no pasan las dos con un solo lugar
+    _esperando.add(id_trabajo)
+    try:
+        await asyncio.to_thread(
+            _ejecutar_sql,
+            "INSERT INTO trabajos (id, tipo, estado, instancia, creado, latido) VALUES (?, ?, 'en_cola', ?, ?, ?)",
+            (id_trabajo, tipo, INSTANCIA, ahora, ahora),
+        )
+    except BaseException:
+        _esperando.discard(id_trabajo)
+        raise
+    tarea = asyncio.create_task(_ejecutar(id_trabajo, funcion, args))
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+    return id_trabajo
+
+def respuesta_aceptado(id_trabajo: str) -> JSONResponse:
+    """202 con el id del trabajo y dónde consultar su avance."""
+    url = f"/jobs/{id_trabajo}"
+    return JSONResponse(
+        status_code=202,
+        content={"status": "accepted", "job_id": id_trabajo, "estado_url": url},
+        headers={"Location": url},
+    )
+
+async def _ejecutar(id_trabajo, funcion, args):
+    global _semaforo, _duracion_media
+    if _semaforo is None:
+        _semaforo = asyncio.Semaphore(TRABAJOS_CONCURRENTES)
+    trabajo = Trabajo(id_trabajo)
+    inicio = None
+    try:
+        async with _semaforo:
+            _esperando.discard(id_trabajo)
+            inicio = time.perf_counter()
+            ahora = time.time()
+            await asyncio.to_thread(
+                _ejecutar_sql,
+                "UPDATE trabajos SET estado = 'procesando', iniciado = ?, latido = ? WHERE id = ?",
+                (ahora, ahora, id_trabajo),
+            )
+            resultado = await funcion(trabajo, *args)
+            await trabajo.esperar_escrituras()
+            await asyncio.to_thread(
+                _ejecutar_sql,
+                "UPDATE trabajos SET estado = 'completado', etapa = 'completado', procesadas = COALESCE(total, procesadas), "
+                "terminado = ?, resultado = ? WHERE id = ?",
+                (time.time(), json.dumps(resultado, ensure_ascii=False, default=str), id_trabajo),
+            )
+    except asyncio.CancelledError:
+        _ejecutar_sql(
+            "UPDATE trabajos SET estado = 'interrumpido', terminado = ?, error = ? WHERE id = ?",
+            (time.time(), "El servidor se detuvo antes de terminar.", id_trabajo),
+        )
+        raise
+    except Exception as e:
+        print(f"❌ [TRABAJO {id_trabajo}] {e}")
+        await trabajo.esperar_escrituras()
+        await asyncio.to_thread(
+            _ejecutar_sql,
+            "UPDATE trabajos SET estado = 'error', terminado = ?, error = ? WHERE id = ?",
+            (time.time(), str(e), id_trabajo),
+        )
+    finally:
+        _esperando.discard(id_trabajo)
+        if inicio is not None:
+            # Media móvil, como en admision: alcanza para sugerir un Retry-After razonable
+            duracion = time.perf_counter() - inicio
+            _duracion_media = duracion if _duracion_media is None else 0.8 * _duracion_media + 0.2 * duracion
+
+def _latir():
+    _ejecutar_sql(
+        f"UPDATE trabajos SET latido = ? WHERE instancia = ? AND estado IN {ESTADOS_ACTIVOS}",
+        (time.time(), INSTANCIA),
+    )
+    _marcar_huerfanos()
+
+async def mantener_latido():
+    """Tarea de fondo: mantiene vivos los trabajos activos de este worker y da por perdidos los de workers caídos."""
+    while True:
+        await asyncio.sleep(INTERVALO_LATIDO)
+        try:
+            await asyncio.to_thread(_latir)
+        except sqlite3.Error as e:
+            print(f"⚠️ No se pudo actualizar el latido de los trabajos: {e}")
+
+async def cerrar():
+    """Al apagar el worker: cancela sus trabajos (quedan como interrumpidos)."""
+    for tarea in list(_tareas):
+        tarea.cancel()
+    await asyncio.gather(*_tareas, return_exceptions=True)
+
+def obtener(id_trabajo: str):
+    """
+    Estado del trabajo con velocidad y ETA calculadas, o None si no existe.
+    Solo lee: un trabajo activo sin latido se informa como interrumpido aunque
+    el próximo latido todavía no lo haya marcado en la tabla.
+    """
+    conn = _conectar()
+    try:
+        fila = conn.execute("SELECT * FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+    finally:
+        conn.close()
+    if fila is None:
+        return None
+
+    huerfano = fila["estado"] in ESTADOS_ACTIVOS and (fila["latido"] or 0) < time.time() - LATIDO_VENCIDO
+    estado = {
+        "id": fila["id"],
+        "tipo": fila["tipo"],
+        "estado": "interrumpido" if huerfano else fila["estado"],
+        "etapa": fila["etapa"],
+        "procesadas": fila["procesadas"],
+        "total": fila["total"],
+        "unidad": fila["unidad"],
+        "por_segundo": None,
+        "eta_segundos": None,
+        "segundos_en_cola": round((fila["iniciado"] or time.time()) - fila["creado"], 1),
+        "segundos_procesando": None,
+        "resultado": json.loads(fila["resultado"]) if fila["resultado"] else None,
+        "error": ERROR_HUERFANO if huerfano else fila["error"],
+        "datos_disponibles": os.path.exists(ruta_resultado(fila["id"])),
+    }
+    if fila["iniciado"]:
+        fin = fila["terminado"] or time.time()
+        estado["segundos_procesando"] = round(fin - fila["iniciado"], 1)
+        transcurrido = (fila["actualizado"] or fin) - fila["iniciado"]
+        if fila["procesadas"] and transcurrido > 0:
+            velocidad = fila["procesadas"] / transcurrido
+            estado["por_segundo"] = round(velocidad, 1)
+            # Con todas las filas cargadas queda el merge final: no hay ETA que calcular
+            if fila["estado"] == "procesando" and fila["total"] and fila["procesadas"] < fila["total"]:
+                estado["eta_segundos"] = round(max(fila["total"] - fila["procesadas"], 0) / velocidad, 1)
+    return estado
@@ -0,0 +1,177 @@
+import os
+import zlib
+import asyncio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.exceptions import HTTPException
+
+try:
+    import brotli   # opcional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Respuestas más chicas que esto (bytes) se envían sin comprimir: no vale la pena
+COMPRESION_MINIMA = int(os.getenv("COMPRESION_MINIMA", "1024"))
+COMPRESION_NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "5"))
+COMPRESION_CALIDAD_BROTLI = int(os.getenv("COMPRESION_CALIDAD_BROTLI", "4"))
+# Tope del cuerpo de una petición gzip ya descomprimido (protege contra "zip bombs")
+MAX_CUERPO_DESCOMPRIMIDO = int(os.getenv("MAX_CUERPO_DESCOMPRIMIDO_MB", "512")) * 1024 * 1024
+
+# Bloques más grandes que esto se comprimen en un hilo, para no frenar el event loop
+BLOQUE_EN_HILO = 256 * 1024
+
+# Contenido que ya viene comprimido: recomprimirlo solo gasta CPU
+TIPOS_YA_COMPRIMIDOS = (
+    "application/zip", "application/gzip", "application/x-gzip",
+    "application/vnd.openxmlformats", "image/", "video/", "audio/",
+)
+
+def elegir_codificacion(accept_encoding: str):
+    """'br' o 'gzip' según el Accept-Encoding del cliente (respetando q=), o None."""
+    pesos = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.partition(";")
+        peso = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                peso = float(parametros[2:])
+            except ValueError:
+                peso = 0.0
+        pesos[nombre.strip()] = peso
+
+    def peso(codificacion):
+        return pesos.get(codificacion, pesos.get("*", 0.0))
+
+    candidatas = (["br"] if brotli is not None else []) + ["gzip"]
+    # A igual peso gana la primera (brotli: ~15-20% más chico que gzip con JSON)
+    mejor = max(candidatas, key=peso)
+    return mejor if peso(mejor) > 0 else None
+
+class _Compresor:
+    def __init__(self, codificacion: str):
+        if codificacion == "br":
+            self._c = brotli.Compressor(quality=COMPRESION_CALIDAD_BROTLI)
+            self._procesar, self._terminar = self._c.process, self._c.finish
+        else:
+            self._c = zlib.compressobj(COMPRESION_NIVEL_GZIP, zlib.DEFLATED, 31)   # 31 = formato gzip
+            self._procesar, self._terminar = self._c.compress, self._c.flush
+
+    def bloque(self, datos: bytes, fin: bool) -> bytes:
+        salida = self._procesar(datos) if datos else b""
+        return salida + self._terminar() if fin else salida
+
+class CompresionMiddleware:
+    """
+    Comprime con brotli (si está instalado) o gzip las respuestas que superan
+    COMPRESION_MINIMA, según lo que acepte el cliente. Funciona también con las
+    respuestas en streaming (NDJSON): cada bloque se comprime a medida que sale.
+    """
+
+    def __init__(self, app, minimo: int = COMPRESION_MINIMA):
+        self.app = app
+        self.minimo = minimo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        codificacion = elegir_codificacion(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacion is None:
+            return await self.app(scope, receive, send)
+
+        inicio = None
+        compresor = None
+        sin_comprimir = False
+
+        async def enviar(mensaje):
+            nonlocal inicio, compresor, sin_comprimir
+            if mensaje["type"] == "http.response.start":
+                # Se retiene hasta ver el primer bloque del cuerpo: ahí se decide si comprimir
+                inicio = mensaje
+                return
+            if sin_comprimir or mensaje["type"] != "http.response.body":
+                if inicio is not None:
+                    await send(inicio)
+                    inicio = None
+                await send(mensaje)
+                return
+
+            cuerpo = mensaje.get("body", b"")
+            hay_mas = mensaje.get("more_body", False)
+            if compresor is None:
+                cabeceras = MutableHeaders(raw=inicio["headers"])
+                tipo = cabeceras.get("content-type", "")
+                if (
+                    "content-encoding" in cabeceras
+                    or tipo.startswith(TIPOS_YA_COMPRIMIDOS)
+                    or inicio["status"] in (204, 304)
+                    or (not hay_mas and len(cuerpo) < self.minimo)
+                ):
+                    sin_comprimir = True
+                    await send(inicio)
+                    await send(mensaje)
+                    inicio = None
+                    return
+                compresor = _Compresor(codificacion)
+                del cabeceras["content-length"]
+                cabeceras["content-encoding"] = codificacion
+                cabeceras.add_vary_header("Accept-Encoding")
+                # La representación comprimida no es idéntica byte a byte: el ETag pasa a ser débil
+                etag = cabeceras.get("etag")
+                if etag and not etag.startswith("W/"):
+                    cabeceras["etag"] = f"W/{etag}"
+                await send(inicio)
+                inicio = None
+
+            if len(cuerpo) > BLOQUE_EN_HILO:
+                datos = await asyncio.to_thread(compresor.bloque, cuerpo, not hay_mas)
+            else:
+                datos = compresor.bloque(cuerpo, not hay_mas)
+            if datos or not hay_mas:
+                await send({"type": "http.response.body", "body": datos, "more_body": hay_mas})
+
+        await self.app(scope, receive, enviar)
+
+class DescompresionMiddleware:
+    """
+    Acepta cuerpos de petición con Content-Encoding: gzip (subidas de Sheets o de
+    scripts que comprimen el JSON o el Excel). Se descomprime en streaming, así los
+    endpoints reciben el cuerpo original sin enterarse.
+    """
+
+    def __init__(self, app, maximo: int = MAX_CUERPO_DESCOMPRIMIDO):
+        self.app = app
+        self.maximo = maximo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if Headers(scope=scope).get("content-encoding", "").strip().lower() != "gzip":
+            return await self.app(scope, receive, send)
+
+        scope = dict(scope)
+        scope["headers"] = [
+            (clave, valor) for clave, valor in scope["headers"]
+            if clave not in (b"content-encoding", b"content-length")
+        ]
+        descompresor = zlib.decompressobj(31)
+        total = 0
+
+        async def recibir():
+            nonlocal total
+            mensaje = await receive()
+            if mensaje["type"] != "http.request":
+                return mensaje
+            hay_mas = mensaje.get("more_body", False)
+            try:
+                # Como mucho lo que falta para el tope (+1 para detectar que se pasó)
+                datos = descompresor.decompress(mensaje.get("body", b""), self.maximo - total + 1)
+            except zlib.error as e:
+                raise HTTPException(status_code=400, detail=f"Cuerpo gzip inválido: {e}")
+            total += len(datos)
+            if total > self.maximo:
+                raise HTTPException(status_code=413, detail=f"El cuerpo descomprimido supera {self.maximo // (1024 * 1024)} MB")
+            if not hay_mas and not descompresor.eof:
+                raise HTTPException(status_code=400, detail="Cuerpo gzip incompleto")
+            return {"type": "http.request", "body": datos, "more_body": hay_mas}
+
+        await self.app(scope, recibir, send)
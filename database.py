@@ -1,26 +1,178 @@
 import os
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.orm import sessionmaker
+import time
+from sqlalchemy import MetaData, event, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from dotenv import load_dotenv
+from metricas import Histograma, Contador, Indicador
 
 load_dotenv()
 
+def _env_int(nombre, defecto):
+    valor = os.getenv(nombre)
+    return int(valor) if valor not in (None, "") else defecto
+
+def _env_bool(nombre, defecto):
+    valor = os.getenv(nombre)
+    if valor in (None, ""):
+        return defecto
+    return valor.strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+
+# ==========================================
+# CONFIGURACIÓN (todo sobreescribible desde el .env)
+# ==========================================
+
 DB_PASSWORD = os.getenv("PGPASSWORD")
-DB_HOST = "gondola.proxy.rlwy.net"
-DB_PORT = "43938"
-DB_USER = "postgres"
-DB_NAME = "railway"
+DB_HOST = os.getenv("PGHOST", "gondola.proxy.rlwy.net")
+DB_PORT = _env_int("PGPORT", 43938)
+DB_USER = os.getenv("PGUSER", "postgres")
+DB_NAME = os.getenv("PGDATABASE", "railway")
+
+def _url_conexion():
+    # DATABASE_URL (como la da Railway) tiene prioridad sobre las variables PG*
+    url = os.getenv("DATABASE_URL")
+    if url:
+        url = make_url(url)
+        # Forzamos el driver asyncpg aunque venga "postgres://" o "postgresql://"
+        if url.drivername in ("postgres", "postgresql") or url.drivername.startswith("postgresql+"):
+            url = url.set(drivername="postgresql+asyncpg")
+        return url
+    # URL de conexión (driver asyncpg: las consultas no bloquean el event loop)
+    return URL.create(
+        "postgresql+asyncpg",
+        username=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT, database=DB_NAME,
+    )
+
+DATABASE_URL = _url_conexion()
+
+# Conexiones fijas por proceso y extra en picos. Total por worker = POOL_SIZE + MAX_OVERFLOW,
+# y (workers x ese total) tiene que entrar en el max_connections de Postgres.
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)        # segundos esperando una conexión libre
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)      # segundos; el proxy de Railway corta conexiones viejas
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)  # 0 = sin límite
+
+# Al arrancar: crear tablas/columnas faltantes, aplicar migraciones y llenar el catálogo si está vacío.
+# Con false el arranque no toca la base (las migraciones se corren con: python -m migraciones)
+INICIALIZAR_ESQUEMA = _env_bool("INICIALIZAR_ESQUEMA", True)
+
+# ==========================================
+# MÉTRICAS DEL POOL Y DE LAS CONSULTAS
+# ==========================================
+
+espera_checkout = Histograma("db_pool_espera_checkout_segundos", "Tiempo esperando una conexión del pool")
+duracion_sentencias = Histograma("db_sentencia_duracion_segundos", "Duración de cada sentencia SQL, por tipo")
+checkouts = Contador("db_pool_checkouts_total", "Conexiones entregadas por el pool")
+checkins = Contador("db_pool_checkins_total", "Conexiones devueltas al pool")
+conexiones_nuevas = Contador("db_pool_conexiones_nuevas_total", "Conexiones abiertas contra Postgres")
+conexiones_invalidadas = Contador("db_pool_invalidaciones_total", "Conexiones descartadas (caídas, pre-ping fallido)")
+timeouts_checkout = Contador("db_pool_timeouts_total", "Pedidos que agotaron DB_POOL_TIMEOUT sin conseguir conexión")
+
+class PoolMedido(AsyncAdaptedQueuePool):
+    """Pool estándar que además mide cuánto espera cada pedido de conexión."""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timeouts_checkout.incrementar()
+            raise
+        finally:
+            espera_checkout.observar(time.perf_counter() - inicio)
 
-# URL de conexión
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+connect_args = {}
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(
+    DATABASE_URL,
+    poolclass=PoolMedido,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=connect_args,
+)
+AsyncSessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
 metadata = MetaData()
 
-def get_db():
-    db = SessionLocal()
-    try:
+Indicador("db_pool_conexiones_en_uso", "Conexiones del pool prestadas en este momento", lambda: engine.sync_engine.pool.checkedout())
+Indicador("db_pool_conexiones_libres", "Conexiones abiertas esperando en el pool", lambda: engine.sync_engine.pool.checkedin())
+
+@event.listens_for(engine.sync_engine, "connect")
+def _al_conectar(dbapi_conn, registro):
+    conexiones_nuevas.incrementar()
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _al_entregar(dbapi_conn, registro, proxy):
+    checkouts.incrementar()
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _al_devolver(dbapi_conn, registro):
+    checkins.incrementar()
+
+@event.listens_for(engine.sync_engine, "invalidate")
+def _al_invalidar(dbapi_conn, registro, excepcion):
+    conexiones_invalidadas.incrementar()
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _antes_de_ejecutar(conn, cursor, sentencia, parametros, contexto, executemany):
+    if contexto is not None:
+        contexto._inicio_sentencia = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _despues_de_ejecutar(conn, cursor, sentencia, parametros, contexto, executemany):
+    inicio = getattr(contexto, "_inicio_sentencia", None)
+    if inicio is not None:
+        # Etiqueta por tipo (SELECT, INSERT, ...) para no tener una serie por consulta
+        tipo = sentencia.lstrip().split(None, 1)[0].upper() if sentencia.strip() else "OTRA"
+        duracion_sentencias.observar(time.perf_counter() - inicio, tipo=tipo)
+
+def estadisticas_pool():
+    """Estado actual del pool + contadores e histogramas acumulados desde el arranque."""
+    pool = engine.sync_engine.pool
+    return {
+        "configuracion": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+        },
+        "conexiones": {
+            "en_uso": pool.checkedout(),
+            "libres": pool.checkedin(),
+            # overflow() arranca en -pool_size: solo es positivo cuando hay conexiones extra abiertas
+            "overflow": max(pool.overflow(), 0),
+            "maximo": DB_POOL_SIZE + DB_MAX_OVERFLOW,
+        },
+        "contadores": {
+            c.nombre: c.valor
+            for c in (checkouts, checkins, conexiones_nuevas, conexiones_invalidadas, timeouts_checkout)
+        },
+        "espera_checkout": espera_checkout.resumen(),
+        "sentencias": duracion_sentencias.resumen(),
+    }
+
+# Sentencias idempotentes que create_all no cubre (columnas o índices nuevos en tablas existentes).
+# Cada router agrega las suyas al importarse.
+ddl_adicional = []
+
+async def inicializar_esquema():
+    async with engine.begin() as conn:
+        # Varios workers arrancando a la vez: create_all en paralelo choca al crear las mismas tablas
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('inicializar_esquema'))"))
+        await conn.run_sync(metadata.create_all)
+        for sentencia in ddl_adicional:
+            await conn.execute(text(sentencia))
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
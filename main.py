@@ -1,20 +1,71 @@
-from fastapi import FastAPI, Request
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routers import stock, archivos, precios # Importamos tus dos archivos nuevos
+from routers import stock, archivos, precios, catalogo, trabajos, busqueda
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from database import engine, AsyncSessionLocal, inicializar_esquema, estadisticas_pool, INICIALIZAR_ESQUEMA
+import migraciones
+from migraciones import aplicar_migraciones
+from cache_consultas import escuchar_invalidaciones, estadisticas_caches
+import cola_trabajos
+from respuestas import RespuestaJSON
+from compresion import CompresionMiddleware, DescompresionMiddleware
+from admision import AdmisionMiddleware
+from metricas import MetricasMiddleware, exportar_prometheus, MEDIA_TYPE_PROMETHEUS
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Crea tablas/columnas faltantes y aplica migraciones (antes se hacía al importar los routers).
+    # Con la base caída la app igual arranca: las consultas fallan hasta que vuelva.
+    # Cada paso por separado: una migración que falla (ej: sin pg_trgm) no deja sin catálogo.
+    if INICIALIZAR_ESQUEMA:
+        try:
+            await inicializar_esquema()
+        except Exception as e:
+            print(f"⚠️ No se pudo preparar la base al arrancar: {e}")
+        else:
+            try:
+                # Cada migración que falla queda en migraciones.fallidas (visible en /db-stats)
+                await aplicar_migraciones()
+            except Exception as e:
+                print(f"⚠️ No se pudieron aplicar las migraciones: {e}")
+            try:
+                async with AsyncSessionLocal() as db:
+                    await catalogo.reconstruir_si_vacio(db)
+            except Exception as e:
+                print(f"⚠️ No se pudo reconstruir el catálogo al arrancar: {e}")
+    # Avisos de Postgres (LISTEN/NOTIFY) para vaciar la caché de consultas cuando otro worker sube datos
+    avisos = asyncio.create_task(escuchar_invalidaciones(engine.url))
+    # Trabajos en segundo plano (?modo=async): estado en SQLite local
+    cola_trabajos.inicializar()
+    latido = asyncio.create_task(cola_trabajos.mantener_latido())
+    yield
+    avisos.cancel()
+    latido.cancel()
+    await cola_trabajos.cerrar()
+    archivos.cerrar_pool_hojas()
+    await engine.dispose()
+
+# Todas las respuestas JSON se serializan con orjson (ver respuestas.py)
+app = FastAPI(lifespan=lifespan, default_response_class=RespuestaJSON)
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     # Esto imprime el error detallado en tu terminal
     print(f"❌ ERROR DE VALIDACIÓN 422: {exc.errors()}")
     # Y esto le devuelve el detalle a Google Sheets (o al navegador)
-    return JSONResponse(
+    return RespuestaJSON(
         status_code=422,
         content={"detail": exc.errors(), "body": exc.body},
     )
+# Latencia por ruta y etapas: va primero (el más interno) para ver la ruta que resolvió el router
+app.add_middleware(MetricasMiddleware)
+# Subidas con Content-Encoding: gzip: se descomprimen dentro de la admisión
+app.add_middleware(DescompresionMiddleware)
+# Tope de tamaño de subida sobre los bytes tal como llegan (413 sin leer el cuerpo) y cupo
+# para las rutas pesadas (429). Queda dentro de CORS para que el navegador pueda leer esas respuestas.
+app.add_middleware(AdmisionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -22,6 +73,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Respuestas comprimidas (gzip/brotli) si el cliente las acepta
+app.add_middleware(CompresionMiddleware)
 
 # Agregamos los routers
 # 1. Rutas de Stock (Eliggi) -> Queda en /upload-sheet
@@ -32,6 +85,30 @@ app.include_router(archivos.router)
 
 # 3. Rutas de Precios (Eliggi) -> Queda en /upload-precios
 app.include_router(precios.router)
+
+# 4. Catálogo combinado (stock + mejor precio) -> Queda en /catalogo
+app.include_router(catalogo.router)
+
+# 5. Estado de trabajos en segundo plano -> Queda en /jobs/{id}
+app.include_router(trabajos.router)
+
+# 6. Búsqueda difusa por descripción, marca o código -> Queda en /buscar
+app.include_router(busqueda.router)
 @app.get("/")
 def home():
-    return {"mensaje": "API Eliggi + Utilidades funcionando 🚀"}
\ No newline at end of file
+    return {"mensaje": "API Eliggi + Utilidades funcionando 🚀"}
+
+@app.get("/db-stats")
+def db_stats():
+    # Conexiones en uso, espera por el pool y latencia de sentencias (para dimensionar workers)
+    return {**estadisticas_pool(), "migraciones_fallidas": migraciones.fallidas}
+
+@app.get("/cache-stats")
+def cache_stats():
+    # Aciertos/fallos de la caché de /stock/{codigo} y /precios/{codigo}
+    return estadisticas_caches()
+
+@app.get("/metrics")
+def metrics():
+    # Formato de texto de Prometheus: latencia por ruta, tiempos por etapa y estado del pool (por worker)
+    return Response(exportar_prometheus(), media_type=MEDIA_TYPE_PROMETHEUS)
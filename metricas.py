@@ -0,0 +1,221 @@
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Límites (en segundos) de los buckets de latencia: de 1 ms a 30 s
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Peticiones y etapas de las subidas grandes pueden durar minutos
+LIMITES_PROCESAMIENTO = LIMITES_LATENCIA + (60.0, 120.0, 300.0, 600.0)
+
+# Todas las métricas creadas, en orden, para exportarlas en /metrics
+REGISTRO = []
+
+class Histograma:
+    """
+    Histograma acumulativo al estilo Prometheus (buckets fijos, conteo y suma),
+    con una serie por combinación de etiquetas. Seguro entre hilos.
+    """
+
+    def __init__(self, nombre: str, descripcion: str, limites=LIMITES_LATENCIA):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.limites = tuple(limites)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRO.append(self)
+
+    def observar(self, valor: float, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        idx = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # Un contador por bucket más el de +Inf, luego conteo y suma
+                serie = self._series[clave] = [[0] * (len(self.limites) + 1), 0, 0.0]
+            serie[0][idx] += 1
+            serie[1] += 1
+            serie[2] += valor
+
+    def series(self):
+        """[(etiquetas, buckets acumulados, conteo, suma)] con una copia consistente de los datos."""
+        with self._lock:
+            copia = [(dict(clave), list(s[0]), s[1], s[2]) for clave, s in self._series.items()]
+        resultado = []
+        for etiquetas, buckets, conteo, suma in copia:
+            acumulado, total = [], 0
+            for n in buckets:
+                total += n
+                acumulado.append(total)
+            resultado.append((etiquetas, acumulado, conteo, suma))
+        return resultado
+
+    def _percentil(self, acumulado, conteo, p):
+        # Cota superior del bucket donde cae el percentil (igual que histogram_quantile, sin interpolar)
+        if not conteo:
+            return None
+        objetivo = p / 100 * conteo
+        for limite, n in zip(self.limites, acumulado):
+            if n >= objetivo:
+                return limite
+        return float("inf")
+
+    def resumen(self):
+        """Lista de series en formato JSON: conteo, promedio y p50/p95/p99 aproximados (en ms)."""
+        salida = []
+        for etiquetas, acumulado, conteo, suma in self.series():
+            fila = dict(etiquetas)
+            fila["conteo"] = conteo
+            fila["promedio_ms"] = round(suma / conteo * 1000, 3) if conteo else None
+            for p in (50, 95, 99):
+                valor = self._percentil(acumulado, conteo, p)
+                fila[f"p{p}_ms"] = None if valor is None else (
+                    f">{self.limites[-1] * 1000:g}" if valor == float("inf") else valor * 1000
+                )
+            salida.append(fila)
+        return salida
+
+class Contador:
+    """Contador monotónico (entero) seguro entre hilos."""
+
+    def __init__(self, nombre: str, descripcion: str):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.valor = 0
+        self._lock = threading.Lock()
+        REGISTRO.append(self)
+
+    def incrementar(self, n: int = 1):
+        with self._lock:
+            self.valor += n
+
+class Indicador:
+    """Valor instantáneo (gauge) que se lee al exportar, llamando a `funcion()`."""
+
+    def __init__(self, nombre: str, descripcion: str, funcion):
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.funcion = funcion
+        REGISTRO.append(self)
+
+# ==========================================
+# LATENCIA POR RUTA Y TIEMPO POR ETAPA
+# ==========================================
+
+duracion_peticiones = Histograma(
+    "http_peticion_duracion_segundos", "Duración de cada petición HTTP, por ruta y status", LIMITES_PROCESAMIENTO
+)
+duracion_etapas = Histograma(
+    "etapa_duracion_segundos", "Tiempo de cada etapa del procesamiento (lectura, parseo, base...), por ruta",
+    LIMITES_PROCESAMIENTO,
+)
+
+# Scope ASGI de la petición en curso: de ahí salen la ruta y el inicio para las etapas.
+# Se hereda en los hilos (to_thread, run_in_threadpool) y en los trabajos lanzados desde la petición.
+_peticion_actual = contextvars.ContextVar("peticion_actual", default=None)
+
+def _ruta(scope) -> str:
+    # La plantilla de la ruta ("/stock/{codigo}"), no la URL: así no hay una serie por código
+    ruta = scope.get("route") if scope is not None else None
+    return getattr(ruta, "path", None) or ("sin_ruta" if scope is not None else "-")
+
+def registrar_etapa(nombre: str, segundos: float):
+    duracion_etapas.observar(segundos, ruta=_ruta(_peticion_actual.get()), etapa=nombre)
+
+def registrar_etapas(tiempos: dict):
+    """Registra varias etapas medidas en otro lado (ej: en los procesos del pool de hojas)."""
+    for nombre, segundos in tiempos.items():
+        registrar_etapa(nombre, segundos)
+
+def registrar_etapa_desde_inicio(nombre: str):
+    """Etapa que va desde que llegó la petición hasta ahora (ej: lo que hace FastAPI antes del endpoint)."""
+    scope = _peticion_actual.get()
+    if scope is not None and "metricas.inicio" in scope:
+        registrar_etapa(nombre, time.perf_counter() - scope["metricas.inicio"])
+
+@contextmanager
+def etapa(nombre: str):
+    """Mide el bloque como una etapa de la petición en curso."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_etapa(nombre, time.perf_counter() - inicio)
+
+class MetricasMiddleware:
+    """
+    Mide cada petición HTTP de punta a punta (incluido el envío de respuestas en
+    streaming) y la registra con su ruta y status en http_peticion_duracion_segundos.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        inicio = scope["metricas.inicio"] = time.perf_counter()
+        token = _peticion_actual.set(scope)
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _peticion_actual.reset(token)
+            duracion_peticiones.observar(
+                time.perf_counter() - inicio, metodo=scope["method"], ruta=_ruta(scope), estado=str(estado)
+            )
+
+# ==========================================
+# EXPORTACIÓN EN FORMATO PROMETHEUS
+# ==========================================
+
+MEDIA_TYPE_PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _etiquetas(etiquetas: dict, extra=None) -> str:
+    pares = list(etiquetas.items()) + (list(extra.items()) if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + "}"
+
+def _numero(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+def exportar_prometheus() -> str:
+    """Todas las métricas del REGISTRO en el formato de texto de Prometheus."""
+    lineas = []
+    for metrica in REGISTRO:
+        if isinstance(metrica, Indicador):
+            try:
+                valor = metrica.funcion()
+            except Exception:
+                # Un indicador que falla no debe tirar el resto del scrape
+                continue
+        ayuda = metrica.descripcion.replace("\\", "\\\\").replace("\n", "\\n")
+        lineas.append(f"# HELP {metrica.nombre} {ayuda}")
+        if isinstance(metrica, Histograma):
+            lineas.append(f"# TYPE {metrica.nombre} histogram")
+            for etiquetas, acumulado, conteo, suma in metrica.series():
+                for limite, n in zip(metrica.limites + (float("inf"),), acumulado):
+                    lineas.append(f"{metrica.nombre}_bucket{_etiquetas(etiquetas, {'le': _numero(limite)})} {n}")
+                lineas.append(f"{metrica.nombre}_sum{_etiquetas(etiquetas)} {_numero(suma)}")
+                lineas.append(f"{metrica.nombre}_count{_etiquetas(etiquetas)} {conteo}")
+        elif isinstance(metrica, Contador):
+            lineas.append(f"# TYPE {metrica.nombre} counter")
+            lineas.append(f"{metrica.nombre} {metrica.valor}")
+        else:
+            lineas.append(f"# TYPE {metrica.nombre} gauge")
+            lineas.append(f"{metrica.nombre} {_numero(valor)}")
+    return "\n".join(lineas) + "\n"
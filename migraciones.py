@@ -0,0 +1,127 @@
+import sys
+import asyncio
+from sqlalchemy import text
+from database import engine
+
+# Cambios de esquema/datos que se aplican una sola vez por base (a diferencia de
+# ddl_adicional, que se repite en cada arranque y tiene que ser idempotente y barato).
+# Se registran en schema_migraciones; las nuevas van al final con un id que no se repita.
+MIGRACIONES = [
+    (
+        "0001_precios_unicos_por_proveedor",
+        [
+            # Bases creadas antes de la restricción única: quedan duplicados (proveedor, codigo).
+            # Se conserva la última fila cargada de cada par.
+            """
+            DELETE FROM lista_precios
+            WHERE id NOT IN (
+                SELECT MAX(id)
+                FROM lista_precios
+                GROUP BY proveedor, codigo
+            )
+            """,
+            # El ON CONFLICT (proveedor, codigo) del merge necesita este índice
+            "CREATE UNIQUE INDEX IF NOT EXISTS uix_prov_cod_precios ON lista_precios (proveedor, codigo)",
+        ],
+    ),
+    (
+        "0002_busqueda_trigramas",
+        [
+            # Índices de trigramas para GET /buscar (routers/busqueda.py)
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            # Texto en minúsculas y sin acentos: IMMUTABLE para poder indexarlo
+            """
+            CREATE OR REPLACE FUNCTION texto_busqueda(codigo text, articulo text, marca text, cod_prov text)
+            RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+                SELECT translate(
+                    lower(coalesce(codigo, '') || ' ' || coalesce(articulo, '') || ' ' ||
+                          coalesce(marca, '') || ' ' || coalesce(cod_prov, '')),
+                    'áàäâéèëêíìïîóòöôúùüûñç', 'aaaaeeeeiiiioooouuuunc'
+                )
+            $$
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_stock_items_busqueda ON stock_items
+            USING gin (texto_busqueda(codigo, articulo, marca, NULL) gin_trgm_ops)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_lista_precios_busqueda ON lista_precios
+            USING gin (texto_busqueda(codigo, articulo, marca, cod_prov) gin_trgm_ops)
+            """,
+        ],
+    ),
+    (
+        "0003_precios_por_codigo",
+        [
+            # El índice único (proveedor, codigo) no sirve para buscar solo por código (no es la primera
+            # columna). Antes lo creaba ddl_adicional: en las bases que ya lo tienen no hace nada.
+            "CREATE INDEX IF NOT EXISTS ix_lista_precios_codigo ON lista_precios (codigo)",
+        ],
+    ),
+    (
+        "0004_stock_reposicion",
+        [
+            # Índice parcial para /stock/reposicion: solo los artículos bajo el mínimo, ya ordenados por código
+            "CREATE INDEX IF NOT EXISTS ix_stock_items_reposicion ON stock_items (codigo) WHERE stock < stock_minimo",
+        ],
+    ),
+]
+
+# Migraciones que fallaron en este proceso: {id: error}. Se reintentan en el próximo arranque
+# (ej: 0002 en un servidor sin pg_trgm instalable). Se muestran en GET /db-stats.
+fallidas = {}
+
+async def aplicar_migraciones() -> list:
+    """
+    Aplica las migraciones pendientes, cada una en su transacción. Con varios
+    workers arrancando a la vez, un advisory lock hace que solo uno las corra.
+    Una que falla queda sin registrar (en `fallidas`) y no frena a las siguientes.
+    Devuelve los ids aplicados.
+    """
+    aplicadas = []
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migraciones'))"))
+        await conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migraciones (
+                id VARCHAR PRIMARY KEY,
+                aplicada TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """))
+    for id_migracion, sentencias in MIGRACIONES:
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migraciones'))"))
+                ya_aplicada = await conn.scalar(
+                    text("SELECT 1 FROM schema_migraciones WHERE id = :id"), {"id": id_migracion}
+                )
+                if ya_aplicada:
+                    fallidas.pop(id_migracion, None)
+                    continue
+                for sentencia in sentencias:
+                    await conn.execute(text(sentencia))
+                await conn.execute(text("INSERT INTO schema_migraciones (id) VALUES (:id)"), {"id": id_migracion})
+        except Exception as e:
+            error = getattr(e, "orig", None) or e
+            fallidas[id_migracion] = str(error)
+            print(f"❌ [MIGRACIÓN] {id_migracion} falló (se reintenta en el próximo arranque): {error}")
+            continue
+        fallidas.pop(id_migracion, None)
+        print(f"🧱 [MIGRACIÓN] {id_migracion} aplicada.")
+        aplicadas.append(id_migracion)
+    return aplicadas
+
+if __name__ == "__main__":
+    # Para aplicarlas a mano cuando el arranque no toca la base (INICIALIZAR_ESQUEMA=false):
+    #   python -m migraciones
+    async def _main():
+        try:
+            aplicadas = await aplicar_migraciones()
+            if fallidas:
+                print(f"⚠️ {len(aplicadas)} migraciones aplicadas, {len(fallidas)} fallidas: {', '.join(fallidas)}")
+            else:
+                print(f"✅ {len(aplicadas)} migraciones aplicadas." if aplicadas else "✅ No hay migraciones pendientes.")
+        finally:
+            await engine.dispose()
+        return 1 if fallidas else 0
+
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,142 @@
+import io
+import os
+import csv
+import json
+import base64
+import asyncio
+import binascii
+import tempfile
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import tuple_
+from database import engine
+from respuestas import linea_ndjson
+
+MEDIA_TYPE_NDJSON = "application/x-ndjson"
+MEDIA_TYPE_CSV = "text/csv; charset=utf-8"
+MEDIA_TYPE_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Filas que trae cada FETCH del cursor del servidor en las exportaciones NDJSON
+FILAS_POR_LOTE_EXPORTACION = 5000
+
+# ==========================================
+# CURSORES (PAGINACIÓN KEYSET)
+# ==========================================
+
+def codificar_cursor(*valores) -> str:
+    """Cursor opaco con los valores de la clave de orden de la última fila enviada."""
+    return base64.urlsafe_b64encode(json.dumps(valores).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decodificar_cursor(cursor: str, cantidad: int) -> list:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return valores
+
+def paginar(query, columnas_orden, cursor, limit):
+    """
+    Ordena `query` por `columnas_orden` (que deben formar una clave única con índice)
+    y, si hay cursor, arranca justo después de la fila que lo generó.
+    Se pide una fila de más para saber si hay otra página sin contar la tabla.
+    """
+    query = query.order_by(*columnas_orden)
+    if cursor:
+        valores = decodificar_cursor(cursor, len(columnas_orden))
+        if len(columnas_orden) == 1:
+            query = query.where(columnas_orden[0] > valores[0])
+        else:
+            # Comparación de filas: Postgres la resuelve con el índice compuesto
+            query = query.where(tuple_(*columnas_orden) > tuple_(*valores))
+    return query.limit(limit + 1)
+
+def separar_pagina(filas, claves_orden, limit):
+    """(filas de la página, cursor siguiente o None si es la última)."""
+    if len(filas) <= limit:
+        return filas, None
+    filas = filas[:limit]
+    ultima = filas[-1]
+    return filas, codificar_cursor(*[ultima[c] for c in claves_orden])
+
+# ==========================================
+# EXPORTACIONES (CURSOR DEL SERVIDOR)
+# ==========================================
+
+async def _lotes(query):
+    """
+    Lotes de FILAS_POR_LOTE_EXPORTACION filas leídos con un cursor del servidor:
+    la memoria no depende del tamaño de la tabla. Usa su propia conexión porque
+    las exportaciones viven más que la petición que las creó.
+    """
+    async with engine.connect() as conn:
+        resultado = await conn.stream(query.execution_options(yield_per=FILAS_POR_LOTE_EXPORTACION))
+        async for lote in resultado.mappings().partitions():
+            yield lote
+
+def exportar_ndjson(query, transformar=dict):
+    """
+    Envía el resultado de `query` como NDJSON, un lote por vez.
+    Un error a mitad de camino se informa como última línea ({"error": ...}).
+    """
+    async def generar():
+        try:
+            async for lote in _lotes(query):
+                yield b"".join(linea_ndjson(transformar(fila)) for fila in lote)
+        except Exception as e:
+            print(f"❌ ERROR EN EXPORTACIÓN: {e}")
+            yield linea_ndjson({"error": str(e)})
+
+    return StreamingResponse(generar(), media_type=MEDIA_TYPE_NDJSON)
+
+def exportar_csv(query, columnas: list, nombre_archivo: str):
+    """
+    Envía el resultado de `query` como CSV en streaming, con `columnas` como encabezado.
+    Lleva BOM para que Excel reconozca el UTF-8 (acentos) al abrirlo con doble clic.
+    Un error a mitad de camino queda como última fila ("ERROR", detalle).
+    """
+    def a_csv(filas) -> bytes:
+        salida = io.StringIO()
+        csv.writer(salida).writerows(filas)
+        return salida.getvalue().encode("utf-8")
+
+    async def generar():
+        yield "\ufeff".encode("utf-8") + a_csv([columnas])
+        try:
+            async for lote in _lotes(query):
+                yield a_csv([fila[c] for c in columnas] for fila in lote)
+        except Exception as e:
+            print(f"❌ ERROR EN EXPORTACIÓN: {e}")
+            yield a_csv([["ERROR", str(e)]])
+
+    return StreamingResponse(generar(), media_type=MEDIA_TYPE_CSV, headers={"Content-Disposition": f'attachment; filename="{nombre_archivo}"'})
+
+def _agregar_filas(hoja, lote, columnas):
+    for fila in lote:
+        hoja.append([fila[c] for c in columnas])
+
+async def exportar_xlsx(query, columnas: list, nombre_archivo: str, nombre_hoja: str = "Datos"):
+    """
+    Arma un .xlsx con openpyxl en modo write_only (las filas van directo a disco, la
+    memoria no crece con la tabla) en un archivo temporal y lo envía con FileResponse,
+    que lo borra al terminar. El libro se escribe entero antes de responder: así un
+    error se informa con un 500 en vez de un archivo cortado.
+    """
+    from openpyxl import Workbook
+    fd, ruta = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        libro = Workbook(write_only=True)
+        hoja = libro.create_sheet(nombre_hoja)
+        hoja.append(columnas)
+        async for lote in _lotes(query):
+            # Generar el XML de cada fila es CPU: fuera del event loop
+            await asyncio.to_thread(_agregar_filas, hoja, lote, columnas)
+        await asyncio.to_thread(libro.save, ruta)
+    except Exception:
+        os.remove(ruta)
+        raise
+    return FileResponse(ruta, media_type=MEDIA_TYPE_XLSX, filename=nombre_archivo, background=BackgroundTask(os.remove, ruta))
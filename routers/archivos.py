@@ -1,39 +1,81 @@
-import io
 import os
+import re
 import json
+import hashlib
+import pathlib
 import shutil
 import sqlite3
 import zipfile
 import tempfile
-import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles.colors import COLOR_INDEX
-from fastapi import APIRouter, UploadFile, File, Form
-from typing import List
+import time
+import pickle
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from pydantic import BaseModel
+from typing import List, Union
+from cache_disco import CacheDisco
+import cola_trabajos
+from respuestas import RespuestaJSON, linea_ndjson
+from admision import pedir_turno_pesado, turno_para_trabajo
+from metricas import etapa, registrar_etapas
 
 router = APIRouter()
 
+# pandas y openpyxl se importan dentro de las funciones que los usan: cargarlos al
+# importar el router sumaba ~0.4 s a cada arranque aunque nadie subiera un Excel.
+
 # ==========================================
 # FUNCIONES AUXILIARES DE COLOR (REFORZADAS)
 # ==========================================
 
-def get_color_from_cell(cell):
+# Clave cruda del relleno de una celda vacía en modo read_only (EmptyCell)
+CLAVE_CELDA_VACIA = ("vacia", None)
+
+def clave_color(cell):
+    """
+    Clave cruda del relleno: ('rgb', 'FF00B050'), ('indexed', 5), ('theme', 4)...
+    Es barata de obtener y determina por completo la clasificación del color.
+    """
     try:
+        if cell.fill is None:
+            return CLAVE_CELDA_VACIA
         if not cell.fill or not hasattr(cell.fill, 'start_color'):
             return None
         sc = cell.fill.start_color
-        if sc.type == 'rgb' and sc.rgb and isinstance(sc.rgb, str):
-            color = str(sc.rgb).upper()
-            return color[-6:] if len(color) >= 6 else color
-        if sc.type == 'indexed' and sc.indexed is not None:
-            try:
-                idx_color = COLOR_INDEX[sc.indexed]
-                return str(idx_color).upper()[-6:]
-            except:
-                pass
-        if sc.type == 'theme':
-            return f"THEME_{sc.theme}"
+        return (sc.type, sc.value)
+    except:
+        return None
+
+def _color_desde_clave(clave):
+    if clave is None:
         return None
+    if clave == CLAVE_CELDA_VACIA:
+        # Celda vacía en modo read_only: equivale al relleno por defecto del libro
+        return "000000"
+    tipo, valor = clave
+    if tipo == 'rgb' and valor and isinstance(valor, str):
+        color = str(valor).upper()
+        return color[-6:] if len(color) >= 6 else color
+    if tipo == 'indexed' and valor is not None:
+        try:
+            from openpyxl.styles.colors import COLOR_INDEX
+            idx_color = COLOR_INDEX[valor]
+            return str(idx_color).upper()[-6:]
+        except:
+            pass
+    if tipo == 'theme':
+        return f"THEME_{valor}"
+    return None
+
+def get_color_from_cell(cell):
+    try:
+        return _color_desde_clave(clave_color(cell))
     except:
         return None
 
@@ -48,20 +90,39 @@ def hex_to_rgb(hex_code):
     except:
         return None
 
-def color_distance(c1, c2):
-    if not c1 or not c2: return 999
-    return sum((a - b) ** 2 for a, b in zip(c1, c2)) ** 0.5
+# Ajuste de objetivos y orden de detección para evitar falsos verdes.
+# El orden importa: gana el primer objetivo dentro de la tolerancia, no el más cercano.
+OBJETIVOS_STOCK = {
+    "CONSULTAR": [(255, 255, 0), (255, 230, 0), (255, 255, 102), (255, 192, 0), (255, 255, 153)],
+    "HAY STOCK": [(0, 176, 80), (0, 255, 0), (146, 208, 80), (0, 128, 0), (0, 255, 153)],
+    "NO HAY STOCK": [(255, 0, 0), (192, 0, 0), (255, 102, 102), (255, 199, 206)]
+}
 
-def interpretar_stock_por_valor_y_color(cell):
-    val_texto = str(cell.value).strip().upper() if cell.value else ""
-    
-    # Prioridad Texto (SI/NO)
-    if val_texto in ["SI", "HAY", "STOCK", "DISPONIBLE"]:
-        return "HAY STOCK", "TEXTO_SI"
-    if val_texto in ["NO", "SIN", "AGOTADO"]:
-        return "NO HAY STOCK", "TEXTO_NO"
+# Tolerancia más ajustada para evitar solapamientos entre amarillo y verde claro
+TOLERANCIA_COLOR = 110
+
+# Paleta precalculada una sola vez (en el mismo orden de detección)
+_PALETA = [(estado, rgb) for estado, colores in OBJETIVOS_STOCK.items() for rgb in colores]
+
+def _estado_por_rgb(rgb):
+    # Distancias al cuadrado (sin raíz) contra la paleta; el resultado queda memoizado por clave.
+    # Con 14 colores el bucle gana a NumPy en cada fallo de caché (ver bench_colores)
+    r, g, b = rgb
+    for estado, (pr, pg, pb) in _PALETA:
+        if (r - pr) ** 2 + (g - pg) ** 2 + (b - pb) ** 2 < TOLERANCIA_COLOR ** 2:
+            return estado
+    return "DESCONOCIDO"
 
-    raw_color = get_color_from_cell(cell)
+@lru_cache(maxsize=4096)
+def clasificar_clave_color(clave):
+    """
+    (estado, raw_color) para una clave de relleno. Una hoja tiene pocas decenas
+    de rellenos distintos, así que casi todas las celdas se resuelven desde la caché.
+    """
+    try:
+        raw_color = _color_desde_clave(clave)
+    except:
+        raw_color = None
     if not raw_color:
         return "NO DEFINIDO", "SIN_INFO"
 
@@ -73,144 +134,661 @@ def interpretar_stock_por_valor_y_color(cell):
         if raw_color in ["THEME_6", "THEME_7"]: return "NO HAY STOCK", raw_color
         return "DESCONOCIDO", raw_color
 
-    # Ajuste de objetivos y orden de detección para evitar falsos verdes
-    targets = {
-        "CONSULTAR": [(255, 255, 0), (255, 230, 0), (255, 255, 102), (255, 192, 0), (255, 255, 153)],
-        "HAY STOCK": [(0, 176, 80), (0, 255, 0), (146, 208, 80), (0, 128, 0), (0, 255, 153)],
-        "NO HAY STOCK": [(255, 0, 0), (192, 0, 0), (255, 102, 102), (255, 199, 206)]
-    }
-    
-    # Tolerancia más ajustada para evitar solapamientos entre amarillo y verde claro
-    TOLERANCIA = 110
+    return _estado_por_rgb(rgb), raw_color
+
+def interpretar_stock_por_valor_y_color(cell):
+    val_texto = str(cell.value).strip().upper() if cell.value else ""
     
-    for estado, colores_rgb in targets.items():
-        for target_rgb in colores_rgb:
-            if color_distance(rgb, target_rgb) < TOLERANCIA:
-                return estado, raw_color
+    # Prioridad Texto (SI/NO)
+    if val_texto in ["SI", "HAY", "STOCK", "DISPONIBLE"]:
+        return "HAY STOCK", "TEXTO_SI"
+    if val_texto in ["NO", "SIN", "AGOTADO"]:
+        return "NO HAY STOCK", "TEXTO_NO"
 
-    return "DESCONOCIDO", raw_color
+    return clasificar_clave_color(clave_color(cell))
 
 # ==========================================
-# ENDPOINT: PROCESAR INVENTARIO
+# LECTURA EN STREAMING (MODO SOLO LECTURA)
 # ==========================================
 
-@router.post("/procesar-inventario-completo/")
-async def procesar_inventario_completo(file: UploadFile = File(...)):
+TAMANO_BLOQUE_UPLOAD = 1024 * 1024  # 1 MB por lectura del upload
+FILAS_BUSQUEDA_ENCABEZADO = 5
+
+async def guardar_upload_en_disco(file: UploadFile, sufijo: str = "", hasher=None) -> str:
+    """
+    Vuelca el upload a un archivo temporal por bloques, sin cargarlo entero en memoria.
+    Si se pasa un `hasher` (ej: hashlib.sha256()) se actualiza con cada bloque.
+    """
+    fd, ruta = tempfile.mkstemp(suffix=sufijo)
+    try:
+        with etapa("lectura_upload"), os.fdopen(fd, "wb") as destino:
+            while True:
+                bloque = await file.read(TAMANO_BLOQUE_UPLOAD)
+                if not bloque:
+                    break
+                if hasher is not None:
+                    hasher.update(bloque)
+                destino.write(bloque)
+    except Exception:
+        os.remove(ruta)
+        raise
+    return ruta
+
+def _indices_columnas(headers):
+    idx_stock = -1
+    idx_codigo = 0
+    for i, h in enumerate(headers):
+        if h == "STOCK": idx_stock = i
+        if h in ["CODIGO", "CODIGOS"]: idx_codigo = i
+    return idx_stock, idx_codigo
+
+def detectar_encabezados(ws):
+    """
+    Busca la fila de encabezados entre las primeras filas de la hoja.
+    Devuelve (fila_encabezado, headers, idx_stock, idx_codigo).
+    """
+    primeras_filas = list(ws.iter_rows(min_row=1, max_row=FILAS_BUSQUEDA_ENCABEZADO))
+
+    for r, row_cells in enumerate(primeras_filas, start=1):
+        temp_headers = [str(c.value).strip().upper() if c.value else "" for c in row_cells]
+        if "STOCK" in temp_headers or "CODIGO" in temp_headers or "CODIGOS" in temp_headers:
+            headers = [h if h else f"COL_{i}" for i, h in enumerate(temp_headers)]
+            return (r, headers) + _indices_columnas(headers)
+
+    # Sin encabezados reconocibles: usamos la primera fila tal cual
+    primera = primeras_filas[0] if primeras_filas else []
+    headers = [str(c.value).strip().upper() if c.value else f"COL_{i}" for i, c in enumerate(primera)]
+    return (1, headers) + _indices_columnas(headers)
+
+def _sumar_tiempo(tiempos, nombre, segundos):
+    if tiempos is not None:
+        tiempos[nombre] = tiempos.get(nombre, 0.0) + segundos
+
+def filas_completas(filas, ancho):
+    """
+    Devuelve las filas como en el modo normal. En modo solo lectura, sin <dimension> en
+    la hoja (libros write_only, algunos exportadores), las filas vienen sin sus celdas
+    vacías del final y las vacías después de la última con datos también salen: las
+    cortas se completan hasta `ancho` y las vacías del final se descartan.
+    """
+    from openpyxl.cell.read_only import EMPTY_CELL
+    vacia = (EMPTY_CELL,) * ancho
+    vacias_pendientes = 0
+    for row in filas:
+        if not row:
+            vacias_pendientes += 1
+            continue
+        for _ in range(vacias_pendientes):
+            yield vacia
+        vacias_pendientes = 0
+        if len(row) < ancho:
+            row = tuple(row) + (EMPTY_CELL,) * (ancho - len(row))
+        yield row
+
+def iterar_items_hoja(ws, sheet_name, tiempos=None):
+    """
+    Genera los items de una hoja de a una fila, sin materializar la hoja completa.
+    Si se pasa `tiempos` (dict) acumula ahí "parseo_filas" y "clasificacion_colores",
+    contando solo el tiempo pasado dentro del generador (no el de quien consume los items).
+    """
+    reloj = time.perf_counter
+    adentro = clasificacion = 0.0
+    reanudado = reloj()
     try:
-        contents = await file.read()
-        wb = load_workbook(io.BytesIO(contents), data_only=True)
-        lista_consolidada = []
+        header_row_idx, headers, idx_stock, idx_codigo = detectar_encabezados(ws)
+        if not headers:
+            return
+
+        # Completas, así STOCK sigue saliendo aunque la fila venga corta (None / DESCONOCIDO / 000000)
+        for row in filas_completas(ws.iter_rows(min_row=header_row_idx + 1), len(headers)):
+            raw_codigo = row[idx_codigo].value
+            if raw_codigo is None or str(raw_codigo).strip() == "":
+                continue
+
+            item = {
+                "ORIGEN_HOJA": sheet_name,
+                "CODIGO": str(raw_codigo).strip()
+            }
+
+            for idx, cell in enumerate(row):
+                if idx >= len(headers): break
+                nombre_col = headers[idx]
+                item[nombre_col] = cell.value
+
+                if idx == idx_stock:
+                    t = reloj()
+                    estado, raw_info = interpretar_stock_por_valor_y_color(cell)
+                    clasificacion += reloj() - t
+                    item["STOCK_ESTADO"] = estado
+                    item["STOCK_DETALLE"] = raw_info
+
+            adentro += reloj() - reanudado
+            yield item
+            reanudado = reloj()
+    finally:
+        adentro += reloj() - reanudado
+        _sumar_tiempo(tiempos, "parseo_filas", adentro - clasificacion)
+        _sumar_tiempo(tiempos, "clasificacion_colores", clasificacion)
+
+def iterar_inventario(ruta, progreso=None):
+    """
+    Abre el libro en modo read_only (sigue exponiendo los rellenos de celda)
+    y recorre todas las hojas de forma perezosa.
+    `progreso(etapa, hojas_listas, total_hojas, unidad)` se llama al terminar cada hoja.
+    """
+    from openpyxl import load_workbook
+    tiempos = {}
+    inicio = time.perf_counter()
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    _sumar_tiempo(tiempos, "carga_libro", time.perf_counter() - inicio)
+    try:
+        for i, sheet_name in enumerate(wb.sheetnames):
+            yield from iterar_items_hoja(wb[sheet_name], sheet_name, tiempos)
+            if progreso:
+                progreso("leyendo hojas", i + 1, len(wb.sheetnames), "hojas")
+    finally:
+        wb.close()
+        registrar_etapas(tiempos)
+
+# ==========================================
+# PROCESAMIENTO PARALELO POR HOJA
+# ==========================================
+
+# Procesos dedicados a parsear hojas (0 o 1 = todo en el mismo proceso)
+EXCEL_WORKERS = int(os.getenv("EXCEL_WORKERS", min(4, os.cpu_count() or 1)))
+
+_pool_hojas = None
 
+def _obtener_pool_hojas():
+    global _pool_hojas
+    if _pool_hojas is None:
+        # "spawn" evita heredar hilos/locks del servidor al hacer fork
+        _pool_hojas = ProcessPoolExecutor(
+            max_workers=EXCEL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool_hojas
+
+def cerrar_pool_hojas():
+    global _pool_hojas
+    if _pool_hojas is not None:
+        _pool_hojas.shutdown(cancel_futures=True)
+        _pool_hojas = None
+
+def nombres_de_hojas(ruta):
+    from openpyxl import load_workbook
+    wb = load_workbook(ruta, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+# Items por bloque al volcar una hoja a disco: el padre nunca tiene más que uno en memoria
+ITEMS_POR_BLOQUE = 5000
+
+def procesar_hoja(ruta, sheet_name):
+    """
+    Se ejecuta en un proceso del pool: detecta encabezados y clasifica colores de una hoja.
+    Los items no vuelven por el pipe de una vez: se vuelcan a un archivo temporal en
+    bloques pickle de ITEMS_POR_BLOQUE, que el servidor lee de a uno (leer_items_volcados).
+    Devuelve (ruta del volcado, tiempos por etapa); las métricas se registran en el servidor.
+    """
+    from openpyxl import load_workbook
+    tiempos = {}
+    inicio = time.perf_counter()
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    _sumar_tiempo(tiempos, "carga_libro", time.perf_counter() - inicio)
+    fd, ruta_items = tempfile.mkstemp(suffix=".items")
+    try:
+        with os.fdopen(fd, "wb") as destino:
+            bloque = []
+            for item in iterar_items_hoja(wb[sheet_name], sheet_name, tiempos):
+                bloque.append(item)
+                if len(bloque) >= ITEMS_POR_BLOQUE:
+                    pickle.dump(bloque, destino, protocol=pickle.HIGHEST_PROTOCOL)
+                    bloque = []
+            if bloque:
+                pickle.dump(bloque, destino, protocol=pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        _borrar_temporal(ruta_items)
+        raise
+    finally:
+        wb.close()
+    return ruta_items, tiempos
+
+def leer_items_volcados(ruta_items):
+    """Genera los items que dejó procesar_hoja, de a un bloque por vez, y borra el volcado."""
+    try:
+        with open(ruta_items, "rb") as origen:
+            while True:
+                try:
+                    bloque = pickle.load(origen)
+                except EOFError:
+                    return
+                yield from bloque
+    finally:
+        _borrar_temporal(ruta_items)
+
+def _descartar_volcado(futuro):
+    # Hoja que nadie va a leer (el cliente cortó): su volcado se borra al terminar
+    if not futuro.cancelled() and futuro.exception() is None:
+        _borrar_temporal(futuro.result()[0])
+
+def iterar_inventario_paralelo(ruta, progreso=None):
+    """
+    Reparte las hojas entre los procesos del pool y entrega los items
+    respetando el orden original de las hojas.
+    Hay a lo sumo EXCEL_WORKERS hojas en curso: la siguiente se envía recién cuando
+    se empieza a leer una terminada, así un libro con muchas hojas no se acumula
+    entero (ni en disco ni en memoria) mientras el cliente consume la primera.
+    """
+    hojas = nombres_de_hojas(ruta)
+    if EXCEL_WORKERS <= 1 or len(hojas) <= 1:
+        yield from iterar_inventario(ruta, progreso)
+        return
+
+    pool = _obtener_pool_hojas()
+    por_enviar = iter(hojas)
+    en_curso = deque()
+
+    def enviar_siguiente():
+        hoja = next(por_enviar, None)
+        if hoja is not None:
+            en_curso.append(pool.submit(procesar_hoja, ruta, hoja))
+
+    for _ in range(EXCEL_WORKERS):
+        enviar_siguiente()
+    try:
+        listas = 0
+        while en_curso:
+            ruta_items, tiempos = en_curso.popleft().result()
+            enviar_siguiente()
+            registrar_etapas(tiempos)
+            yield from leer_items_volcados(ruta_items)
+            listas += 1
+            if progreso:
+                progreso("leyendo hojas", listas, len(hojas), "hojas")
+    finally:
+        # Si el cliente corta el stream no seguimos ocupando el pool
+        for futuro in en_curso:
+            futuro.cancel()
+            futuro.add_done_callback(_descartar_volcado)
+
+def iterar_filas_excel(ruta):
+    """Genera (hoja, fila) para cada fila de datos, usando la primera fila como encabezado."""
+    from openpyxl import load_workbook
+    reloj = time.perf_counter
+    reanudado = reloj()
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    carga = reloj() - reanudado
+    adentro = 0.0
+    reanudado = reloj()
+    try:
         for sheet_name in wb.sheetnames:
             ws = wb[sheet_name]
-            
-            # 1. Encontrar la fila de encabezados
-            header_row_idx = 1
-            idx_stock = -1
-            idx_codigo = 0
-            headers = []
-
-            for r in range(1, 6):
-                row_cells = list(ws.iter_rows(min_row=r, max_row=r))[0]
-                temp_headers = [str(c.value).strip().upper() if c.value else "" for c in row_cells]
-                if "STOCK" in temp_headers or "CODIGO" in temp_headers or "CODIGOS" in temp_headers:
-                    header_row_idx = r
-                    headers = [h if h else f"COL_{i}" for i, h in enumerate(temp_headers)]
-                    for i, h in enumerate(headers):
-                        if h == "STOCK": idx_stock = i
-                        if h in ["CODIGO", "CODIGOS"]: idx_codigo = i
-                    break
-            
-            if not headers:
-                headers = [str(c.value).strip().upper() if c.value else f"COL_{i}" for i, c in enumerate(ws[1])]
-                for i, h in enumerate(headers):
-                    if h == "STOCK": idx_stock = i
-                    if h in ["CODIGO", "CODIGOS"]: idx_codigo = i
-
-            # 2. Procesar filas de datos
-            for row in ws.iter_rows(min_row=header_row_idx + 1):
-                raw_codigo = row[idx_codigo].value
-                if raw_codigo is None or str(raw_codigo).strip() == "":
-                    continue
-
-                item = {
-                    "ORIGEN_HOJA": sheet_name,
-                    "CODIGO": str(raw_codigo).strip()
-                }
-
+            filas = ws.iter_rows()
+            primera = next(filas, None)
+            if primera is None: continue
+            headers = [str(c.value) for c in primera]
+            for row in filas_completas(filas, len(headers)):
+                fila = {}
                 for idx, cell in enumerate(row):
                     if idx >= len(headers): break
-                    nombre_col = headers[idx]
-                    item[nombre_col] = cell.value
+                    fila[headers[idx]] = cell.value
+                adentro += reloj() - reanudado
+                yield sheet_name, fila
+                reanudado = reloj()
+    finally:
+        wb.close()
+        adentro += reloj() - reanudado
+        registrar_etapas({"carga_libro": carga, "parseo_filas": adentro})
+
+def leer_libro(ruta):
+    """Todas las filas del libro agrupadas por hoja (la respuesta JSON de /leer-excel/)."""
+    resultado = {}
+    for sheet_name, fila in iterar_filas_excel(ruta):
+        resultado.setdefault(sheet_name, []).append(fila)
+    return resultado
+
+# ==========================================
+# RESPUESTAS NDJSON (STREAMING)
+# ==========================================
+
+MEDIA_TYPE_NDJSON = "application/x-ndjson"
+
+def _borrar_temporal(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+def respuesta_ndjson(items, ruta_temporal=None, clave_cache=None):
+    """
+    Envía cada item como una línea JSON a medida que se genera.
+    Un error a mitad de camino se informa como última línea ({"error": ...}),
+    porque el status 200 ya fue enviado.
+    Con `clave_cache`, las líneas se copian a la caché de resultados y la entrada
+    se publica solo si el stream terminó completo y sin errores.
+    """
+    def generar():
+        copia = open(cache_resultados.archivo_temporal(), "wb") if clave_cache else None
+        completo = False
+        try:
+            for item in items:
+                linea = linea_ndjson(item)
+                if copia:
+                    copia.write(linea)
+                yield linea
+            completo = True
+        except Exception as e:
+            yield linea_ndjson({"error": str(e)})
+        finally:
+            if ruta_temporal:
+                _borrar_temporal(ruta_temporal)
+            if copia:
+                copia.close()
+                if completo:
+                    cache_resultados.guardar(clave_cache, copia.name)
+                else:
+                    _borrar_temporal(copia.name)
+
+    return StreamingResponse(generar(), media_type=MEDIA_TYPE_NDJSON, headers=_CABECERA_CACHE_MISS if clave_cache else None)
+
+# ==========================================
+# CACHÉ DE RESULTADOS POR HUELLA DEL UPLOAD
+# ==========================================
 
-                    if idx == idx_stock:
-                        estado, raw_info = interpretar_stock_por_valor_y_color(cell)
-                        item["STOCK_ESTADO"] = estado
-                        item["STOCK_DETALLE"] = raw_info
+# Sheets y los cron de proveedores reenvían muchas veces el mismo archivo: la respuesta
+# ya armada se guarda en disco, direccionada por el SHA-256 del upload (calculado mientras
+# se recibe). Subir VERSION_PARSER cuando cambie lo que devuelven los parsers (encabezados,
+# clasificación de colores, columnas...): las entradas viejas dejan de coincidir y se desalojan solas.
+VERSION_PARSER = 2
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+RESULTADOS_MAX_MB = int(os.getenv("RESULTADOS_MAX_MB", 1024))
+cache_resultados = CacheDisco(os.path.join(CACHE_DIR, "resultados"), RESULTADOS_MAX_MB * 1024 * 1024, ".resultado")
 
-                lista_consolidada.append(item)
+_CABECERA_CACHE_MISS = {"X-Cache": "MISS"}
 
-        return {
+def clave_resultado(endpoint: str, huella: str, formato: str, *parametros) -> str:
+    """Endpoint + versión del parser + formato + SHA-256 del archivo (+ parámetros que cambian la respuesta)."""
+    partes = [endpoint, f"v{VERSION_PARSER}", formato, huella, *map(str, parametros)]
+    return hashlib.sha256("\x00".join(partes).encode("utf-8")).hexdigest()
+
+def respuesta_desde_cache(clave: str, media_type: str):
+    """Respuesta con X-Cache: HIT si la entrada existe, o None."""
+    ruta = cache_resultados.obtener(clave)
+    if not ruta:
+        return None
+    try:
+        # Abierto ya: si otro worker la desaloja mientras se envía, el archivo sigue legible
+        archivo = open(ruta, "rb")
+    except FileNotFoundError:
+        return None
+
+    def leer():
+        with archivo:
+            while bloque := archivo.read(TAMANO_BLOQUE_UPLOAD):
+                yield bloque
+
+    cabeceras = {"X-Cache": "HIT", "Content-Length": str(os.fstat(archivo.fileno()).st_size)}
+    return StreamingResponse(leer(), media_type=media_type, headers=cabeceras)
+
+def guardar_resultado(clave: str, cuerpo: bytes):
+    temporal = cache_resultados.archivo_temporal()
+    try:
+        with open(temporal, "wb") as destino:
+            destino.write(cuerpo)
+        cache_resultados.guardar(clave, temporal)
+    except Exception:
+        _borrar_temporal(temporal)
+        raise
+
+async def respuesta_json_cacheada(clave: str, contenido) -> RespuestaJSON:
+    """Serializa `contenido`, lo guarda en la caché de resultados y lo devuelve con X-Cache: MISS."""
+    respuesta = RespuestaJSON(contenido, headers=_CABECERA_CACHE_MISS)
+    await run_in_threadpool(guardar_resultado, clave, respuesta.body)
+    return respuesta
+
+# ==========================================
+# ENDPOINT: PROCESAR INVENTARIO
+# ==========================================
+
+async def _trabajo_inventario(trabajo, ruta, nombre_archivo):
+    # Mismo cupo y presupuesto de memoria que los parseos sincrónicos del endpoint
+    turno = turno_para_trabajo("/procesar-inventario-completo")
+    try:
+        trabajo.progreso("esperando turno", 0)
+        await turno.pedir(os.path.getsize(ruta))
+        items = await run_in_threadpool(list, iterar_inventario_paralelo(ruta, trabajo.progreso))
+        resumen = {"archivo": nombre_archivo, "total_items": len(items)}
+        # Los items van a un archivo aparte: GET /jobs/{id}/resultado
+        await run_in_threadpool(trabajo.guardar_datos, {**resumen, "datos": items})
+        return resumen
+    finally:
+        turno.liberar()
+        _borrar_temporal(ruta)
+
+@router.post("/procesar-inventario-completo/")
+async def procesar_inventario_completo(
+    request: Request, file: UploadFile = File(...), formato: str = "json", modo: str = "sync", forzar: bool = False
+):
+    """
+    Uso: /procesar-inventario-completo/?formato=ndjson para recibir un item por línea
+    mientras se lee el libro (por defecto devuelve un único JSON).
+    Con ?modo=async responde 202 con un job_id (429 con la cola de trabajos llena); el avance
+    (por hoja) se consulta en GET /jobs/{job_id} y los items en GET /jobs/{job_id}/resultado.
+    Un archivo idéntico a uno ya procesado se responde desde la caché (X-Cache: HIT);
+    ?forzar=true lo vuelve a procesar.
+    """
+    ruta = None
+    try:
+        hasher = hashlib.sha256()
+        ruta = await guardar_upload_en_disco(file, ".xlsx", hasher)
+        if modo == "async":
+            id_trabajo = await cola_trabajos.encolar("procesar-inventario", _trabajo_inventario, ruta, file.filename)
+            # Encolado: el trabajo se encarga de borrar el temporal al terminar (con un 429 lo borra el finally)
+            ruta = None
+            return cola_trabajos.respuesta_aceptado(id_trabajo)
+
+        clave = clave_resultado("procesar-inventario", hasher.hexdigest(), formato, file.filename)
+        if not forzar:
+            cacheada = respuesta_desde_cache(clave, MEDIA_TYPE_NDJSON if formato == "ndjson" else "application/json")
+            if cacheada:
+                return cacheada
+        # Recién ahora ocupa cupo de trabajo pesado (429 si no hay lugar); un HIT no lo usa
+        await pedir_turno_pesado(request, os.path.getsize(ruta))
+        if formato == "ndjson":
+            # El generador se encarga de borrar el temporal al terminar
+            ruta_stream, ruta = ruta, None
+            return respuesta_ndjson(iterar_inventario_paralelo(ruta_stream), ruta_stream, clave)
+
+        # Se espera fuera del event loop para no bloquear al resto de las peticiones
+        lista_consolidada = await run_in_threadpool(list, iterar_inventario_paralelo(ruta))
+
+        # Respuesta armada directamente: son decenas de MB y así se evita jsonable_encoder
+        return await respuesta_json_cacheada(clave, {
             "archivo": file.filename,
             "total_items": len(lista_consolidada),
             "datos": lista_consolidada
-        }
+        })
 
+    except StarletteHTTPException:
+        # 413/429 de la admisión y 400 de un gzip inválido: llegan con su status
+        raise
     except Exception as e:
         import traceback
         return {"error": str(e), "trace": traceback.format_exc()}
+    finally:
+        if ruta:
+            _borrar_temporal(ruta)
 
 @router.post("/leer-excel/")
-async def leer_excel(file: UploadFile = File(...)):
+async def leer_excel(request: Request, file: UploadFile = File(...), formato: str = "json", forzar: bool = False):
+    """
+    Uso: /leer-excel/?formato=ndjson devuelve líneas {"hoja": ..., "fila": {...}}.
+    Un archivo ya leído se responde desde la caché (X-Cache: HIT); ?forzar=true lo vuelve a leer.
+    """
+    ruta = None
     try:
-        contents = await file.read()
-        wb = load_workbook(io.BytesIO(contents), data_only=True)
-        resultado = {}
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            if ws.max_row < 2: continue
-            headers = [str(c.value) for c in ws[1]]
-            hoja_datos = []
-            for row in ws.iter_rows(min_row=2):
-                fila = {}
-                for idx, cell in enumerate(row):
-                    if idx >= len(headers): break
-                    fila[headers[idx]] = cell.value
-                hoja_datos.append(fila)
-            resultado[sheet_name] = hoja_datos
-        return resultado
+        hasher = hashlib.sha256()
+        ruta = await guardar_upload_en_disco(file, ".xlsx", hasher)
+        clave = clave_resultado("leer-excel", hasher.hexdigest(), formato)
+        if not forzar:
+            cacheada = respuesta_desde_cache(clave, MEDIA_TYPE_NDJSON if formato == "ndjson" else "application/json")
+            if cacheada:
+                return cacheada
+        await pedir_turno_pesado(request, os.path.getsize(ruta))
+        if formato == "ndjson":
+            ruta_stream, ruta = ruta, None
+            filas = ({"hoja": hoja, "fila": fila} for hoja, fila in iterar_filas_excel(ruta_stream))
+            return respuesta_ndjson(filas, ruta_stream, clave)
+
+        # Fuera del event loop: las consultas no esperan a que termine de leerse el libro
+        resultado = await run_in_threadpool(leer_libro, ruta)
+        # Fechas y números de las celdas los serializa orjson sin pasar por jsonable_encoder
+        return await respuesta_json_cacheada(clave, resultado)
+    except StarletteHTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
+    finally:
+        if ruta:
+            _borrar_temporal(ruta)
+
+# ==========================================
+# ZIP + SQLITE DE PROVEEDORES
+# ==========================================
+
+EXTENSIONES_SQLITE = ('.sqlite', '.db', '.sqlite3')
+
+def extraer_sqlite_de_zip(zip_path, destino):
+    """
+    Extrae solo la primera base SQLite del ZIP, copiándola por bloques a `destino`.
+    Imágenes, PDFs y demás miembros no se escriben a disco.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        for info in zf.infolist():
+            if info.filename.endswith(EXTENSIONES_SQLITE):
+                with zf.open(info) as origen, open(destino, "wb") as salida:
+                    shutil.copyfileobj(origen, salida, TAMANO_BLOQUE_UPLOAD)
+                return destino
+    return None
+
+# Catálogos ya extraídos e indexados, direccionados por el SHA-256 del ZIP
+CATALOGOS_MAX_MB = int(os.getenv("CATALOGOS_MAX_MB", 2048))
+cache_catalogos = CacheDisco(os.path.join(CACHE_DIR, "catalogos"), CATALOGOS_MAX_MB * 1024 * 1024, ".sqlite")
+
+_SHA256_VALIDO = re.compile(r"^[0-9a-f]{64}$")
+
+def indexar_catalogo(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_articulos_codigo ON Articulos (Codigo)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_articulos_codigo_particular ON Articulos (CodigoParticular)")
+        conn.commit()
+    finally:
+        conn.close()
+
+def ingerir_catalogo(zip_path, catalogo):
+    """
+    Devuelve la ruta del catálogo en caché. Si no estaba, extrae la base del ZIP,
+    crea los índices de búsqueda y la publica en la caché.
+    """
+    ruta = cache_catalogos.obtener(catalogo)
+    if ruta:
+        return ruta
+    temporal = cache_catalogos.archivo_temporal()
+    try:
+        if not extraer_sqlite_de_zip(zip_path, temporal):
+            return None
+        indexar_catalogo(temporal)
+        return cache_catalogos.guardar(catalogo, temporal)
+    finally:
+        _borrar_temporal(temporal)
+
+def buscar_articulos(db_path, codigos, codigos_prov):
+    """
+    Busca en Articulos por Codigo o CodigoParticular con una sola consulta.
+    Los códigos se cargan en tablas temporales, así que no hay límite de
+    variables enlazadas sin importar cuántos códigos lleguen.
+    """
+    if not codigos and not codigos_prov:
+        return []
+    # Solo lectura: el archivo puede ser una entrada compartida de la caché de catálogos
+    conn = sqlite3.connect(f"{pathlib.Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        # Columna sin tipo: se comparan igual que los parámetros del IN (?, ?, …) anterior
+        conn.execute("CREATE TEMP TABLE buscar_codigos (valor)")
+        conn.execute("CREATE TEMP TABLE buscar_codigos_prov (valor)")
+        conn.executemany("INSERT INTO temp.buscar_codigos VALUES (?)", ((c,) for c in codigos))
+        conn.executemany("INSERT INTO temp.buscar_codigos_prov VALUES (?)", ((c,) for c in codigos_prov))
+        query = """
+            SELECT DISTINCT * FROM Articulos
+            WHERE Codigo IN (SELECT valor FROM temp.buscar_codigos)
+               OR CodigoParticular IN (SELECT valor FROM temp.buscar_codigos_prov)
+        """
+        import pandas as pd
+        return pd.read_sql_query(query, conn).to_dict(orient="records")
+    finally:
+        conn.close()
 
 @router.post("/procesar-zip-sqlite/")
-async def procesar_zip_sqlite(file: UploadFile = File(...), codigos: str = Form(...), codigosProveedor: str = Form(...)):
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, "archivo.zip")
+async def procesar_zip_sqlite(
+    request: Request, file: UploadFile = File(...), codigos: str = Form(...), codigosProveedor: str = Form(...),
+    forzar: bool = False,
+):
+    """
+    Busca códigos en la base SQLite del ZIP. El catálogo queda en caché y la
+    respuesta incluye su hash ("catalogo") para consultarlo después por
+    /catalogos/{catalogo}/buscar sin volver a subir el archivo.
+    El mismo ZIP con los mismos códigos se responde desde la caché (X-Cache: HIT);
+    ?forzar=true repite la búsqueda.
+    """
+    zip_path = None
     try:
         lista_codigos = json.loads(codigos) if codigos else []
         lista_codigos_prov = json.loads(codigosProveedor) if codigosProveedor else []
-        with open(zip_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        db_path = None
-        with zipfile.ZipFile(zip_path, 'r') as zf:
-            zf.extractall(temp_dir)
-            for f in zf.namelist():
-                if f.endswith(('.sqlite', '.db', '.sqlite3')):
-                    db_path = os.path.join(temp_dir, f)
-                    break
+        hasher = hashlib.sha256()
+        zip_path = await guardar_upload_en_disco(file, ".zip", hasher)
+        catalogo = hasher.hexdigest()
+        clave = clave_resultado("procesar-zip-sqlite", catalogo, "json", codigos, codigosProveedor)
+        # Solo si el catálogo sigue en caché: la respuesta invita a consultarlo por su hash
+        if not forzar and cache_catalogos.obtener(catalogo):
+            cacheada = respuesta_desde_cache(clave, "application/json")
+            if cacheada:
+                return cacheada
+        await pedir_turno_pesado(request, os.path.getsize(zip_path))
+        with etapa("extraccion_zip"):
+            db_path = await run_in_threadpool(ingerir_catalogo, zip_path, catalogo)
         if not db_path: return {"error": "No hay base de datos"}
-        conn = sqlite3.connect(db_path)
-        dfs = []
-        if lista_codigos:
-            p = ','.join('?' for _ in lista_codigos)
-            dfs.append(pd.read_sql_query(f"SELECT * FROM Articulos WHERE Codigo IN ({p})", conn, params=lista_codigos))
-        if lista_codigos_prov:
-            p = ','.join('?' for _ in lista_codigos_prov)
-            dfs.append(pd.read_sql_query(f"SELECT * FROM Articulos WHERE CodigoParticular IN ({p})", conn, params=lista_codigos_prov))
-        resultado = pd.concat(dfs).drop_duplicates().to_dict(orient="records") if dfs else []
-        conn.close()
-        return {"mensaje": "Éxito", "total": len(resultado), "datos": resultado}
+        with etapa("consulta_sqlite"):
+            resultado = await run_in_threadpool(buscar_articulos, db_path, lista_codigos, lista_codigos_prov)
+        return await respuesta_json_cacheada(
+            clave, {"mensaje": "Éxito", "catalogo": catalogo, "total": len(resultado), "datos": resultado}
+        )
+    except StarletteHTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
     finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
\ No newline at end of file
+        if zip_path:
+            _borrar_temporal(zip_path)
+
+class BusquedaCatalogo(BaseModel):
+    codigos: List[Union[str, int]] = []
+    codigosProveedor: List[Union[str, int]] = []
+
+@router.post("/catalogos/{catalogo}/buscar")
+async def buscar_en_catalogo(catalogo: str, busqueda: BusquedaCatalogo):
+    """
+    Busca códigos en un catálogo ya subido, identificado por su SHA-256.
+    Body: {"codigos": [...], "codigosProveedor": [...]}
+    """
+    if not _SHA256_VALIDO.match(catalogo):
+        raise HTTPException(status_code=400, detail="El catálogo debe ser un SHA-256 en hexadecimal")
+    db_path = cache_catalogos.obtener(catalogo)
+    if not db_path:
+        raise HTTPException(status_code=404, detail=f"Catálogo '{catalogo}' no está en caché, subilo por /procesar-zip-sqlite/")
+    with etapa("consulta_sqlite"):
+        resultado = await run_in_threadpool(buscar_articulos, db_path, busqueda.codigos, busqueda.codigosProveedor)
+    return {"mensaje": "Éxito", "catalogo": catalogo, "total": len(resultado), "datos": resultado}
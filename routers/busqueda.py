@@ -0,0 +1,121 @@
+import os
+import re
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+
+router = APIRouter()
+
+# Búsqueda difusa por descripción: índices GIN de trigramas (pg_trgm) sobre
+# texto_busqueda(codigo, articulo, marca, cod_prov) en stock_items y lista_precios.
+# La función y los índices los crea la migración 0002 (migraciones.py).
+
+# Similitud mínima de cada palabra (0-1). Más bajo tolera más errores de tipeo pero trae más ruido.
+BUSQUEDA_UMBRAL = float(os.getenv("BUSQUEDA_UMBRAL", "0.5"))
+MAX_PALABRAS = 8
+LIMITE_MAXIMO_BUSQUEDA = 100
+
+# undefined_function: sin pg_trgm (migración 0002 fallida) no existen `<%` ni texto_busqueda()
+_SQLSTATE_SIN_TRIGRAMAS = "42883"
+
+# Mismo reemplazo que hace texto_busqueda() en la base (translate de la migración 0002)
+_SIN_ACENTOS = str.maketrans("áàäâéèëêíìïîóòöôúùüûñç", "aaaaeeeeiiiioooouuuunc")
+
+# Índices que se ponen al día después de cada subida (ver actualizar_indice_busqueda)
+INDICES_BUSQUEDA = {
+    "stock_items": "ix_stock_items_busqueda",
+    "lista_precios": "ix_lista_precios_busqueda",
+}
+
+# Expresión indexada de cada tabla: tiene que coincidir con la del CREATE INDEX para que se use el índice
+_TEXTO_TABLA = {
+    "stock_items": "texto_busqueda(codigo, articulo, marca, NULL)",
+    "lista_precios": "texto_busqueda(codigo, articulo, marca, cod_prov)",
+}
+
+def palabras_de_busqueda(q: str) -> list:
+    """Normaliza como la base (minúsculas, sin acentos) y separa en palabras, sin repetidas."""
+    normalizado = q.lower().translate(_SIN_ACENTOS)
+    return list(dict.fromkeys(re.findall(r"[a-z0-9]+", normalizado)))[:MAX_PALABRAS]
+
+def _coincidencias(tabla: str, cantidad: int) -> str:
+    # Todas las palabras tienen que aparecer (con errores de tipeo): cada `<%` usa el índice GIN
+    texto = _TEXTO_TABLA[tabla]
+    condiciones = " AND ".join(f":p{i} <% {texto}" for i in range(cantidad))
+    puntaje = " + ".join(f"word_similarity(:p{i}, {texto})" for i in range(cantidad))
+    return f"""
+        SELECT codigo, ({puntaje}) / {cantidad} + (upper(codigo) = :codigo)::int AS puntaje
+        FROM {tabla}
+        WHERE {condiciones}
+        ORDER BY puntaje DESC
+        LIMIT :tope
+    """
+
+def sql_busqueda(cantidad: int) -> str:
+    """Consulta para `cantidad` palabras (:p0, :p1, ...): mejor puntaje por código, con stock y mejor precio."""
+    return f"""
+        WITH coincidencias AS (
+            ({_coincidencias("stock_items", cantidad)})
+            UNION ALL
+            ({_coincidencias("lista_precios", cantidad)})
+        ),
+        mejores AS (
+            SELECT codigo, max(puntaje) AS puntaje FROM coincidencias GROUP BY codigo
+        )
+        SELECT c.codigo, c.articulo, c.marca, c.stock, c.stock_minimo, c.precio_final, c.proveedor,
+               round(m.puntaje::numeric, 3) AS puntaje
+        FROM mejores m
+        JOIN catalogo_combinado c ON c.codigo = m.codigo
+        ORDER BY m.puntaje DESC, c.codigo
+        LIMIT :limite
+    """
+
+async def actualizar_indice_busqueda(db: AsyncSession, tabla: str):
+    """
+    Pasa al índice principal las entradas que la subida dejó en la lista pendiente
+    del GIN (fastupdate), así la primera búsqueda después de una carga grande no
+    tiene que recorrerla. Si el índice no existe (sin pg_trgm) no hace nada.
+    """
+    await db.execute(
+        text("SELECT gin_clean_pending_list(to_regclass(:indice))"), {"indice": INDICES_BUSQUEDA[tabla]}
+    )
+    await db.commit()
+
+@router.get("/buscar")
+async def buscar(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(20, ge=1, le=LIMITE_MAXIMO_BUSQUEDA),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Busca artículos por descripción, marca, código o código de proveedor, tolerando
+    errores de tipeo y el orden de las palabras. Ej: /buscar?q=filtro aceite vw
+    Devuelve los códigos ordenados por puntaje (1 = todas las palabras exactas;
+    un código idéntico a la búsqueda suma 1) con su stock y mejor precio.
+    """
+    palabras = palabras_de_busqueda(q)
+    if not palabras:
+        raise HTTPException(status_code=400, detail="La búsqueda no tiene letras ni números")
+    try:
+        parametros = {f"p{i}": palabra for i, palabra in enumerate(palabras)}
+        # El umbral de `<%` es un parámetro de pg_trgm; `true` lo limita a esta transacción
+        await db.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :umbral, true)"),
+            {"umbral": str(BUSQUEDA_UMBRAL)},
+        )
+        filas = (await db.execute(
+            text(sql_busqueda(len(palabras))),
+            {**parametros, "codigo": q.strip().upper(), "tope": limit * 5, "limite": limit},
+        )).mappings().all()
+        return {"busqueda": q, "total": len(filas), "resultados": filas}
+    except DBAPIError as e:
+        if getattr(e.orig, "sqlstate", None) == _SQLSTATE_SIN_TRIGRAMAS:
+            raise HTTPException(
+                status_code=503,
+                detail="La búsqueda no está disponible: la base no tiene la extensión pg_trgm (ver /db-stats)",
+            )
+        # El error de SQLAlchemy trae la consulta entera: queda en el log, no en la respuesta
+        print(f"❌ [BÚSQUEDA] {e.orig}")
+        raise HTTPException(status_code=500, detail="Error en la búsqueda")
@@ -0,0 +1,166 @@
+import os
+import time
+import hashlib
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlalchemy import Table, Column, String, Float, DateTime, text, select, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import metadata, get_db
+from cache_consultas import cache_catalogo, avisar_cambio, FALTA
+from paginacion import paginar, separar_pagina
+from respuestas import a_json
+
+router = APIRouter()
+
+# Catálogo combinado: una fila por código con su stock y el mejor precio entre proveedores.
+# Se mantiene al día desde las subidas (refrescar_catalogo), así las lecturas no hacen el join.
+tabla_catalogo = Table(
+    "catalogo_combinado",
+    metadata,
+    Column("codigo", String, primary_key=True),
+    Column("articulo", String),
+    Column("marca", String),
+    Column("stock", Float),
+    Column("stock_minimo", Float),
+    Column("precio_final", Float),      # el menor precio_final > 0 entre proveedores
+    Column("proveedor", String),        # proveedor de ese precio
+    Column("actualizado", DateTime(timezone=True)),
+)
+
+LIMITE_MAXIMO_PAGINA = 10000
+
+# Segundos que un cliente/CDN puede reutilizar una página sin revalidar (0 = revalidar siempre con ETag)
+CATALOGO_MAX_AGE = int(os.getenv("CATALOGO_MAX_AGE", "0"))
+
+# Códigos a recalcular: los indicados, o todos (reconstrucción; incluye los del catálogo para borrar huérfanos)
+_CODIGOS_INDICADOS = "SELECT DISTINCT unnest(CAST(:codigos AS VARCHAR[])) AS codigo"
+_TODOS_LOS_CODIGOS = (
+    "SELECT codigo FROM stock_items UNION SELECT codigo FROM lista_precios "
+    "UNION SELECT codigo FROM catalogo_combinado"
+)
+
+_SQL_REFRESCO = """
+WITH afectados AS ({codigos}),
+mejor AS (
+    -- Un precio por código: primero los mayores a cero, el más barato, y a igualdad el proveedor
+    SELECT DISTINCT ON (lp.codigo) lp.codigo, lp.precio_final, lp.proveedor, lp.articulo, lp.marca
+    FROM lista_precios lp
+    JOIN afectados a ON a.codigo = lp.codigo
+    ORDER BY lp.codigo, (lp.precio_final > 0) IS NOT TRUE, lp.precio_final, lp.proveedor
+),
+nuevos AS (
+    SELECT a.codigo,
+           COALESCE(s.articulo, m.articulo) AS articulo,
+           COALESCE(s.marca, m.marca) AS marca,
+           s.stock, s.stock_minimo,
+           CASE WHEN m.precio_final > 0 THEN m.precio_final END AS precio_final,
+           CASE WHEN m.precio_final > 0 THEN m.proveedor END AS proveedor
+    FROM afectados a
+    LEFT JOIN stock_items s ON s.codigo = a.codigo
+    LEFT JOIN mejor m ON m.codigo = a.codigo
+    WHERE s.codigo IS NOT NULL OR m.codigo IS NOT NULL
+),
+borrados AS (
+    DELETE FROM catalogo_combinado c
+    USING afectados a
+    WHERE c.codigo = a.codigo AND NOT EXISTS (SELECT 1 FROM nuevos n WHERE n.codigo = a.codigo)
+)
+INSERT INTO catalogo_combinado AS c (codigo, articulo, marca, stock, stock_minimo, precio_final, proveedor, actualizado)
+SELECT codigo, articulo, marca, stock, stock_minimo, precio_final, proveedor, now() FROM nuevos
+ON CONFLICT (codigo) DO UPDATE SET
+    articulo = EXCLUDED.articulo, marca = EXCLUDED.marca,
+    stock = EXCLUDED.stock, stock_minimo = EXCLUDED.stock_minimo,
+    precio_final = EXCLUDED.precio_final, proveedor = EXCLUDED.proveedor,
+    actualizado = EXCLUDED.actualizado
+WHERE (c.articulo, c.marca, c.stock, c.stock_minimo, c.precio_final, c.proveedor)
+      IS DISTINCT FROM
+      (EXCLUDED.articulo, EXCLUDED.marca, EXCLUDED.stock, EXCLUDED.stock_minimo, EXCLUDED.precio_final, EXCLUDED.proveedor)
+"""
+
+async def refrescar_catalogo(db: AsyncSession, codigos=None) -> int:
+    """
+    Recalcula en catalogo_combinado las filas de `codigos` (o de todo, si es None).
+    Corre dentro de la transacción de la subida, así el catálogo cambia junto con
+    los datos de origen. No hace commit. Devuelve las filas insertadas o modificadas.
+    """
+    if codigos is not None:
+        codigos = sorted(set(codigos))
+        if not codigos:
+            return 0
+        sql = text(_SQL_REFRESCO.format(codigos=_CODIGOS_INDICADOS)).bindparams(
+            bindparam("codigos", codigos, type_=ARRAY(String))
+        )
+    else:
+        sql = text(_SQL_REFRESCO.format(codigos=_TODOS_LOS_CODIGOS))
+
+    # Serializa con otros refrescos: una subida de stock y otra de precios sobre el mismo código
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('catalogo_combinado'))"))
+    cambiadas = (await db.execute(sql)).rowcount
+    if cambiadas:
+        await avisar_cambio(db, cache_catalogo.nombre)
+    return cambiadas
+
+async def reconstruir_si_vacio(db: AsyncSession):
+    """Primer arranque con el catálogo nuevo: se llena una vez a partir de stock y precios."""
+    if (await db.execute(select(tabla_catalogo.c.codigo).limit(1))).first() is not None:
+        return
+    inicio = time.perf_counter()
+    filas = await refrescar_catalogo(db)
+    await db.commit()
+    if filas:
+        print(f"📚 [CATÁLOGO] Reconstruido con {filas} códigos en {time.perf_counter() - inicio:.2f}s.")
+
+def _respuesta_cacheable(request: Request, cuerpo: bytes, etag: str) -> Response:
+    cabeceras = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CATALOGO_MAX_AGE}" if CATALOGO_MAX_AGE > 0 else "public, no-cache",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
+
+@router.get("/catalogo")
+async def obtener_catalogo(
+    request: Request,
+    limit: int = Query(1000, ge=1, le=LIMITE_MAXIMO_PAGINA),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Catálogo combinado (stock + mejor precio) paginado por código.
+    Uso: /catalogo?limit=1000 y luego /catalogo?cursor=<siguiente_cursor> hasta que sea null.
+    Cada página lleva ETag: con If-None-Match se responde 304 sin cuerpo.
+    """
+    try:
+        clave = (cursor, limit)
+        pagina = cache_catalogo.obtener(clave)
+        if pagina is FALTA:
+            version = cache_catalogo.version
+            query = paginar(select(tabla_catalogo), [tabla_catalogo.c.codigo], cursor, limit)
+            filas = (await db.execute(query)).mappings().all()
+            filas, siguiente = separar_pagina(filas, ["codigo"], limit)
+            cuerpo = a_json({"total_enviados": len(filas), "siguiente_cursor": siguiente, "data": [dict(f) for f in filas]})
+            pagina = (cuerpo, f'"{hashlib.blake2b(cuerpo, digest_size=16).hexdigest()}"')
+            cache_catalogo.guardar(clave, pagina, version)
+
+        return _respuesta_cacheable(request, *pagina)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ ERROR: {e}")
+        raise HTTPException(status_code=500, detail=f"Error al obtener catálogo: {str(e)}")
+
+@router.post("/catalogo/reconstruir")
+async def reconstruir_catalogo(db: AsyncSession = Depends(get_db)):
+    """Recalcula el catálogo completo (por si se tocaron las tablas de origen a mano)."""
+    try:
+        inicio = time.perf_counter()
+        filas = await refrescar_catalogo(db)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        print(f"❌ ERROR: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    cache_catalogo.invalidar()
+    return {"status": "success", "filas_actualizadas": filas, "segundos": round(time.perf_counter() - inicio, 3)}
@@ -1,10 +1,23 @@
-import logging
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException
+import time
+import asyncio
+from typing import List, Optional, Union, TYPE_CHECKING
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from pydantic import BaseModel, Field, validator
-from sqlalchemy import Table, Column, Integer, String, Float, UniqueConstraint
-from sqlalchemy.dialects.postgresql import insert
-from database import engine, metadata, SessionLocal
+from sqlalchemy import Table, Column, Integer, String, Float, UniqueConstraint, select, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, AsyncSessionLocal, metadata, ddl_adicional, get_db
+from carga_masiva import sincronizar_con_huellas, con_reintentos
+from carga_columnar import leer_cuerpo_columnar, armar_dataframe, campos_de_modelo, a_float, texto_opcional, ErroresColumnar
+from cache_consultas import cache_precios, cache_catalogo, avisar_cambio, FALTA
+from routers.catalogo import refrescar_catalogo
+from routers.busqueda import actualizar_indice_busqueda
+import cola_trabajos
+from paginacion import paginar, separar_pagina, exportar_ndjson
+from metricas import etapa, registrar_etapa_desde_inicio
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 router = APIRouter()
 
@@ -19,11 +32,27 @@ tabla_precios = Table(
     Column("marca", String),
     Column("rubro", String),
     Column("cod_prov", String),
+    # Huella del contenido para la sincronización por diferencias
+    Column("huella", String),
     # RESTRICCIÓN CLAVE: Único el par proveedor-codigo
     UniqueConstraint('proveedor', 'codigo', name='uix_prov_cod_precios'),
 )
 
-metadata.create_all(bind=engine)
+# La tabla se crea al arrancar, en database.inicializar_esquema.
+# create_all no agrega columnas a una tabla existente:
+ddl_adicional.append("ALTER TABLE lista_precios ADD COLUMN IF NOT EXISTS huella VARCHAR")
+# El índice por código lo crea la migración 0003 (migraciones.py)
+
+# Orden de las columnas en la carga masiva
+COLUMNAS_PRECIOS = ["codigo", "articulo", "proveedor", "precio_final", "marca", "cod_prov", "rubro"]
+
+# Columnas que se devuelven en las consultas (la huella es interna)
+COLUMNAS_PUBLICAS_PRECIOS = [c for c in tabla_precios.c if c.name != "huella"]
+
+LIMITE_MAXIMO_PAGINA = 10000
+
+# Códigos por pedido en /precios/lookup
+LIMITE_CODIGOS_LOOKUP = 10000
 
 class FilaPrecio(BaseModel):
     codigo: str = Field(alias="Código")
@@ -46,134 +75,286 @@ class FilaPrecio(BaseModel):
             return float(v.replace('.', '').replace(',', '.'))
         return float(v)
 
-from sqlalchemy import text # IMPORTANTE: Asegúrate de tener esta importación arriba
+class ConsultaLotePrecios(BaseModel):
+    codigos: List[Union[str, int]] = Field(default=[], max_length=LIMITE_CODIGOS_LOOKUP)
+    proveedor: Optional[str] = None
+
+def filas_desde_modelos(datos: List[FilaPrecio]) -> List[tuple]:
+    """Tuplas en el orden de COLUMNAS_PRECIOS."""
+    return [(f.codigo, f.articulo, f.proveedor, f.precio, f.marca, f.cod_prov, f.rubro) for f in datos]
+
+# ==========================================
+# FORMATO COLUMNAR (validación en bloque con pandas)
+# ==========================================
+
+CAMPOS_COLUMNAR_PRECIOS = campos_de_modelo(FilaPrecio)
+
+def _texto_obligatorio(serie: "pd.Series") -> list:
+    """Igual que limpiar_obligatorios: None -> "S/D", números sin ".0", texto sin espacios."""
+    texto = serie.astype(str).str.strip()
+    numeros = serie.map(lambda v: isinstance(v, (int, float))).to_numpy(dtype=bool)
+    texto[numeros] = texto[numeros].str.replace(".0", "", regex=False)
+    texto[serie.map(lambda v: v is None).to_numpy(dtype=bool)] = "S/D"
+    return texto.tolist()
+
+def _precios(serie: "pd.Series", errores: ErroresColumnar) -> list:
+    """Igual que limpiar_precio: vacíos -> 0.0 y texto con formato 1.234,56."""
+    import numpy as np
+    vacios = serie.map(lambda v: not v).to_numpy(dtype=bool)
+    valores = np.zeros(len(serie))
+    resto = serie[~vacios]
+    es_texto = resto.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    resto = resto.copy()
+    resto[es_texto] = resto[es_texto].str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    valores[~vacios] = a_float(resto, errores, "C. Final")
+    return valores.tolist()
+
+def normalizar_columnar_precios(columnas, filas) -> List[tuple]:
+    """
+    Valida y normaliza el formato columnar con las mismas reglas que FilaPrecio,
+    pero por columna en vez de fila por fila. Devuelve tuplas (COLUMNAS_PRECIOS)
+    o lanza 422 con los errores encontrados.
+    """
+    df = armar_dataframe(columnas, filas, CAMPOS_COLUMNAR_PRECIOS)
+    n = len(df)
+    errores = ErroresColumnar()
+
+    if "codigo" not in df:
+        errores.agregar(range(n), "Código", "Field required")
+        codigo = [None] * n
+    else:
+        codigo = _texto_obligatorio(df["codigo"])
+    proveedor = _texto_obligatorio(df["proveedor"]) if "proveedor" in df else ["GENERAL"] * n
+    precio = _precios(df["precio"], errores) if "precio" in df else [0.0] * n
+
+    opcionales = {}
+    for campo in ("articulo", "marca", "cod_prov", "rubro"):
+        alias = CAMPOS_COLUMNAR_PRECIOS[campo][0]
+        opcionales[campo] = texto_opcional(df[campo], errores, alias) if campo in df else [None] * n
 
-def guardar_precios_db(datos: List[FilaPrecio]):
+    errores.lanzar_si_hay()
+    return list(zip(
+        codigo, opcionales["articulo"], proveedor, precio,
+        opcionales["marca"], opcionales["cod_prov"], opcionales["rubro"],
+    ))
+
+async def guardar_precios_db(db: AsyncSession, filas: List[tuple], progreso=None):
+    """`filas`: tuplas en el orden de COLUMNAS_PRECIOS (ver filas_desde_modelos)."""
     print("\n" + "═"*60)
-    print(f"💰 [PRECIOS] Procesando {len(datos)} filas.")
-    
-    db = SessionLocal()
-    total_afectados = 0
+    print(f"💰 [PRECIOS] Procesando {len(filas)} filas.")
     
-    # --- 🛠️ ESTO ES LO QUE DEBES AGREGAR / MODIFICAR ---
-    try:
-        # 1. Borramos duplicados existentes para permitir la creación del índice
-        sql_limpieza = text("""
-            DELETE FROM lista_precios 
-            WHERE id NOT IN (
-                SELECT MAX(id) 
-                FROM lista_precios 
-                GROUP BY proveedor, codigo
-            );
-        """)
-        db.execute(sql_limpieza)
-        
-        # 2. Creamos el índice único que PostgreSQL necesita para el ON CONFLICT
-        db.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uix_prov_cod_precios ON lista_precios (proveedor, codigo);"))
-        db.commit()
-        print("✅ Base de datos limpiada e índice verificado.")
-    except Exception as e:
-        db.rollback()
-        print(f"⚠️ Nota en mantenimiento: {e}")
-    # --------------------------------------------------
+    # La limpieza de duplicados y el índice único (proveedor, codigo) ya no corren en cada
+    # subida: son la migración 0001 (migraciones.py), aplicada una vez al arrancar.
 
     # MANEJO DE DUPLICADOS EN LA ENTRADA (Memoria)
-    limpios = {(f.proveedor, f.codigo): f for f in datos}
-    datos_lista = list(limpios.values())
-    batch_size = 1000
+    limpios = {(f[2], f[0]): f for f in filas}
+    filas = list(limpios.values())
 
-    try:
-        for i in range(0, len(datos_lista), batch_size):
-            batch = datos_lista[i : i + batch_size]
-            datos_batch = []
-            for f in batch:
-                datos_batch.append({
-                    "codigo": f.codigo,
-                    "articulo": f.articulo,
-                    "proveedor": f.proveedor,
-                    "precio_final": f.precio,
-                    "marca": f.marca,
-                    "cod_prov": f.cod_prov,
-                    "rubro": f.rubro
-                })
-            
-            # Upsert (Insertar o Actualizar)
-            stmt = insert(tabla_precios).values(datos_batch)
-            statement_upsert = stmt.on_conflict_do_update(
-                index_elements=['proveedor', 'codigo'],
-                set_={
-                    "articulo": stmt.excluded.articulo,
-                    "precio_final": stmt.excluded.precio_final,
-                    "marca": stmt.excluded.marca,
-                    "rubro": stmt.excluded.rubro,
-                    "cod_prov": stmt.excluded.cod_prov
-                }
+    # Solo se comparan huellas de los proveedores presentes en la subida
+    proveedores = sorted({f[2] for f in filas})
+
+    inicio = time.perf_counter()
+
+    async def transaccion():
+        # Solo las filas nuevas o cambiadas van por COPY + merge, todo en una transacción
+        with etapa("upsert_db"):
+            conteo = await sincronizar_con_huellas(
+                db, tabla_precios, COLUMNAS_PRECIOS, ["proveedor", "codigo"], filas,
+                tabla_precios.c.proveedor == any_(bindparam("proveedores", proveedores, type_=ARRAY(String))),
+                progreso,
             )
-            
-            result = db.execute(statement_upsert)
-            db.commit() # Confirmar cada lote
-            
-            total_afectados += (result.rowcount if result.rowcount > 0 else 0)
-            print(f"⏳ [PRECIOS] {min(i + batch_size, len(datos_lista))} / {len(datos_lista)}...")
-
-        return total_afectados
+        claves_cambiadas = conteo.pop("claves_cambiadas")
+        if conteo["insertados"] or conteo["actualizados"]:
+            if progreso:
+                progreso("actualizando catálogo", len(filas), len(filas))
+            # Catálogo combinado: solo los códigos que cambiaron, en la misma transacción
+            with etapa("refresco_catalogo"):
+                await refrescar_catalogo(db, [clave[1] for clave in claves_cambiadas])
+            # Se entrega a todos los workers recién con el commit
+            await avisar_cambio(db, cache_precios.nombre)
+        with etapa("commit"):
+            await db.commit()
+        return conteo
+
+    try:
+        # Un corte de conexión o un deadlock repite la carga entera (hace rollback antes)
+        conteo = await con_reintentos(db, transaccion, "PRECIOS")
     except Exception as e:
-        db.rollback()
         print(f"❌ ERROR EN GUARDADO: {e}")
         raise e
-    finally:
-        db.close()
+    hubo_cambios = conteo["insertados"] or conteo["actualizados"]
+    if hubo_cambios:
+        # Este worker no espera al aviso: la próxima consulta ya ve los datos nuevos
+        cache_precios.invalidar()
+        cache_catalogo.invalidar()
+        try:
+            with etapa("indice_busqueda"):
+                await actualizar_indice_busqueda(db, "lista_precios")
+        except Exception as e:
+            # Los datos ya están guardados: el índice se pone al día igual con el autovacuum
+            await db.rollback()
+            print(f"⚠️ [BÚSQUEDA] No se pudo actualizar el índice de lista_precios: {e}")
 
-@router.post("/upload-precios")
-async def upload_precios(filas: List[FilaPrecio]):
+    segundos = time.perf_counter() - inicio
+    filas_por_segundo = len(filas) / segundos if segundos > 0 else 0.0
+    print(
+        f"✅ [PRECIOS] {len(filas)} filas en {segundos:.2f}s ({filas_por_segundo:.0f} filas/s): "
+        f"{conteo['insertados']} nuevas, {conteo['actualizados']} actualizadas, {conteo['sin_cambios']} sin cambios."
+    )
+    return {
+        "filas": len(filas),
+        **conteo,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(filas_por_segundo),
+    }
+
+async def _trabajo_precios(trabajo, filas: List[tuple]):
+    # El trabajo sobrevive a la petición: usa su propia sesión
+    async with AsyncSessionLocal() as db:
+        return await guardar_precios_db(db, filas, progreso=trabajo.progreso)
+
+async def _subir_precios(filas: List[tuple], modo: str, db: AsyncSession):
+    if modo == "async":
+        return cola_trabajos.respuesta_aceptado(await cola_trabajos.encolar("upload-precios", _trabajo_precios, filas))
     try:
-        total = guardar_precios_db(filas)
-        return {"status": "success", "cambios_db": total}
+        resultado = await guardar_precios_db(db, filas)
+        return {
+            "status": "success",
+            "insertados": resultado["insertados"],
+            "actualizados": resultado["actualizados"],
+            "sin_cambios": resultado["sin_cambios"],
+            "filas_por_segundo": resultado["filas_por_segundo"],
+        }
     except Exception as e:
         # Esto te dirá el error real en Postman
         raise HTTPException(status_code=500, detail=str(e))
 
-# ... (tus imports y código anterior)
+@router.post("/upload-precios")
+async def upload_precios(filas: List[FilaPrecio], modo: str = "sync", db: AsyncSession = Depends(get_db)):
+    """
+    Con ?modo=async responde 202 con un job_id enseguida y procesa en segundo plano
+    (429 con Retry-After si la cola de trabajos está llena); el avance se consulta en GET /jobs/{job_id}.
+    """
+    # Lectura del cuerpo, parseo del JSON y validación de pydantic las hizo FastAPI antes de llegar acá
+    registrar_etapa_desde_inicio("validacion")
+    return await _subir_precios(filas_desde_modelos(filas), modo, db)
+
+@router.post("/upload-precios/columnar")
+async def upload_precios_columnar(request: Request, modo: str = "sync", db: AsyncSession = Depends(get_db)):
+    """
+    Mismo efecto que /upload-precios con un cuerpo más liviano:
+    {"columnas": ["Código", "Proveedor", "C. Final", ...], "filas": [["A1", "ZERBINI", "1.234,50"], ...]}
+    Acepta Content-Encoding: gzip. La validación se hace por columna (pandas) en vez de fila por fila.
+    """
+    with etapa("lectura_upload"):
+        columnas, filas_crudas = await leer_cuerpo_columnar(request)
+    with etapa("validacion"):
+        filas = await asyncio.to_thread(normalizar_columnar_precios, columnas, filas_crudas)
+    return await _subir_precios(filas, modo, db)
 
 @router.get("/precios")
-async def obtener_todos_los_precios(limit: int = 100, skip: int = 0):
+async def obtener_todos_los_precios(
+    limit: int = Query(100, ge=1, le=LIMITE_MAXIMO_PAGINA),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
+    formato: str = "json",
+    db: AsyncSession = Depends(get_db),
+):
     """
-    Retorna la lista de precios con paginación.
-    Uso: /precios?limit=50&skip=0
+    Retorna la lista de precios ordenada por (proveedor, codigo), paginada por cursor.
+    Uso: /precios?limit=50 y luego /precios?limit=50&cursor=<siguiente_cursor>
+    hasta que siguiente_cursor sea null. Con ?formato=ndjson exporta toda la
+    lista en streaming (un precio por línea).
+    `skip` (OFFSET) se mantiene por compatibilidad: se vuelve lento en páginas profundas.
     """
-    db = SessionLocal()
+    orden = [tabla_precios.c.proveedor, tabla_precios.c.codigo]
+    if formato == "ndjson":
+        return exportar_ndjson(select(*COLUMNAS_PUBLICAS_PRECIOS).order_by(*orden))
     try:
-        # Construimos la consulta seleccionando todos los campos de la tabla
-        query = select(tabla_precios).offset(skip).limit(limit)
-        result = db.execute(query).mappings().all()
-        
+        query = paginar(select(*COLUMNAS_PUBLICAS_PRECIOS), orden, cursor, limit)
+        if skip and not cursor:
+            query = query.offset(skip)
+        result = (await db.execute(query)).mappings().all()
+        result, siguiente = separar_pagina(result, ["proveedor", "codigo"], limit)
+
         return {
             "total_enviados": len(result),
+            "siguiente_cursor": siguiente,
             "data": result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener precios: {str(e)}")
-    finally:
-        db.close()
+
+@router.post("/precios/lookup")
+async def buscar_precios_por_lote(consulta: ConsultaLotePrecios, db: AsyncSession = Depends(get_db)):
+    """
+    Resuelve muchos códigos en una sola consulta (ej: las 2000 líneas de un presupuesto).
+    Body: {"codigos": [...], "proveedor": "ZERBINI"}  (proveedor es opcional)
+    Respuesta: {"encontrados": {codigo: [precios...]}, "no_encontrados": [...]}
+    """
+    try:
+        # Sin repetidos y en el orden recibido
+        codigos = list(dict.fromkeys(str(c).strip() for c in consulta.codigos))
+        proveedor = consulta.proveedor or None
+
+        # Comparte la caché con /precios/{codigo}: misma clave (codigo, proveedor)
+        encontrados, pendientes = {}, []
+        for codigo in codigos:
+            resultado = cache_precios.obtener((codigo, proveedor))
+            if resultado is FALTA:
+                pendientes.append(codigo)
+            elif resultado:
+                encontrados[codigo] = resultado
+
+        if pendientes:
+            version = cache_precios.version
+            query = select(*COLUMNAS_PUBLICAS_PRECIOS).where(
+                tabla_precios.c.codigo == any_(bindparam("codigos", pendientes, type_=ARRAY(String)))
+            )
+            if proveedor:
+                query = query.where(tabla_precios.c.proveedor == proveedor)
+
+            agrupados = {}
+            for fila in (await db.execute(query)).mappings():
+                agrupados.setdefault(fila["codigo"], []).append(fila)
+            for codigo in pendientes:
+                resultado = agrupados.get(codigo, [])
+                cache_precios.guardar((codigo, proveedor), resultado, version)
+                if resultado:
+                    encontrados[codigo] = resultado
+
+        return {
+            "encontrados": {codigo: encontrados[codigo] for codigo in codigos if codigo in encontrados},
+            "no_encontrados": [codigo for codigo in codigos if codigo not in encontrados],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en la búsqueda: {str(e)}")
 
 @router.get("/precios/{codigo}")
-async def obtener_precio_por_codigo(codigo: str, proveedor: Optional[str] = None):
+async def obtener_precio_por_codigo(codigo: str, proveedor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
     """
     Busca un código específico. 
     Opcionalmente puedes filtrar por proveedor: /precios/VTH123?proveedor=ZERBINI
+    El resultado queda en memoria hasta la próxima subida de precios.
     """
-    db = SessionLocal()
     try:
         # Limpiamos el código por si viene con espacios desde la URL
         codigo_limpio = codigo.strip()
         
-        query = select(tabla_precios).where(tabla_precios.c.codigo == codigo_limpio)
-        
-        # Si pasan el proveedor por parámetro, filtramos también por él
-        if proveedor:
-            query = query.where(tabla_precios.c.proveedor == proveedor)
-            
-        result = db.execute(query).mappings().all()
+        clave = (codigo_limpio, proveedor or None)
+        result = cache_precios.obtener(clave)
+        if result is FALTA:
+            version = cache_precios.version
+            query = select(*COLUMNAS_PUBLICAS_PRECIOS).where(tabla_precios.c.codigo == codigo_limpio)
+
+            # Si pasan el proveedor por parámetro, filtramos también por él
+            if proveedor:
+                query = query.where(tabla_precios.c.proveedor == proveedor)
+
+            result = (await db.execute(query)).mappings().all()
+            cache_precios.guardar(clave, result, version)
 
         if not result:
             raise HTTPException(status_code=404, detail=f"Código '{codigo_limpio}' no encontrado")
@@ -186,16 +367,18 @@ async def obtener_precio_por_codigo(codigo: str, proveedor: Optional[str] = None
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la búsqueda: {str(e)}")
-    finally:
-        db.close()
 
 @router.get("/debug-columnas")
 async def debug_columnas():
     from sqlalchemy import inspect
-    inspector = inspect(engine)
-    columnas = inspector.get_columns("lista_precios")
-    indices = inspector.get_indexes("lista_precios")
+
+    def inspeccionar(conn):
+        inspector = inspect(conn)
+        return inspector.get_columns("lista_precios"), inspector.get_indexes("lista_precios")
+
+    async with engine.connect() as conn:
+        columnas, indices = await conn.run_sync(inspeccionar)
     return {
         "columnas_reales_en_db": [c['name'] for c in columnas],
         "indices_detectados": indices
-    }
\ No newline at end of file
+    }
@@ -1,10 +1,20 @@
-import logging
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException
+import time
+import asyncio
+from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from pydantic import BaseModel, Field, field_validator, ConfigDict
-from sqlalchemy import Table, Column, Integer, String, Float, UniqueConstraint
-from sqlalchemy.dialects.postgresql import insert
-from database import engine, metadata, SessionLocal
+from sqlalchemy import Table, Column, Integer, String, Float, UniqueConstraint, text, select, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, metadata, ddl_adicional, get_db
+from carga_masiva import sincronizar_con_huellas, con_reintentos
+from carga_columnar import leer_cuerpo_columnar, armar_dataframe, campos_de_modelo, a_float, texto_opcional, ErroresColumnar
+from cache_consultas import cache_stock, cache_catalogo, avisar_cambio, FALTA
+from routers.catalogo import refrescar_catalogo
+from routers.busqueda import actualizar_indice_busqueda
+import cola_trabajos
+from paginacion import paginar, separar_pagina, exportar_ndjson, exportar_csv, exportar_xlsx
+from metricas import etapa, registrar_etapa_desde_inicio
 
 router = APIRouter()
 
@@ -20,10 +30,27 @@ tabla_stock = Table(
     Column("stock_minimo", Float, default=0.0),
     Column("stock_optimo", Float, default=0.0),
     Column("marca", String),
+    # Huella del contenido para la sincronización por diferencias
+    Column("huella", String),
 )
 
-# Esto intenta crear la tabla con la restricción UNIQUE si no existe
-metadata.create_all(bind=engine)
+# La tabla (con la restricción UNIQUE) se crea al arrancar, en database.inicializar_esquema.
+# create_all no agrega columnas a una tabla existente:
+ddl_adicional.append("ALTER TABLE stock_items ADD COLUMN IF NOT EXISTS huella VARCHAR")
+# El índice parcial de /stock/reposicion lo crea la migración 0004 (migraciones.py)
+
+# Orden de las columnas en la carga masiva
+COLUMNAS_STOCK = ["codigo", "articulo", "stock", "stock_minimo", "stock_optimo", "marca"]
+
+# Columnas que se devuelven en las consultas (la huella es interna)
+COLUMNAS_PUBLICAS_STOCK = [c for c in tabla_stock.c if c.name != "huella"]
+
+LIMITE_MAXIMO_PAGINA = 10000
+# Página por defecto cuando se pide solo ?cursor=
+LIMITE_PAGINA_STOCK = 1000
+
+# Códigos por pedido en /stock/lookup
+LIMITE_CODIGOS_LOOKUP = 10000
 
 class FilaExcel(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
@@ -54,109 +81,297 @@ class StockResponse(BaseModel):
             return str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
         return str(v).strip()
 
-# --- LÓGICA DE BATCHES ---
-def procesar_guardado_postgres(datos: List[FilaExcel]):
+class ConsultaLoteStock(BaseModel):
+    codigos: List[Union[str, int]] = Field(default=[], max_length=LIMITE_CODIGOS_LOOKUP)
+
+def filas_desde_modelos(datos: List[FilaExcel]) -> List[tuple]:
+    """Tuplas en el orden de COLUMNAS_STOCK."""
+    return [(f.codigo, f.articulo, f.stock, f.stock_minimo, f.stock_optimo, f.marca) for f in datos]
+
+# --- FORMATO COLUMNAR (validación en bloque con pandas) ---
+
+# populate_by_name: se acepta el alias ("Stock Mínimo") o el nombre del campo ("stock_minimo")
+CAMPOS_COLUMNAR_STOCK = campos_de_modelo(FilaExcel, por_nombre=True)
+
+def normalizar_columnar_stock(columnas, filas) -> List[tuple]:
+    """
+    Valida el formato columnar con las mismas reglas que FilaExcel, pero por columna.
+    Devuelve tuplas (COLUMNAS_STOCK) o lanza 422 con los errores encontrados.
+    """
+    df = armar_dataframe(columnas, filas, CAMPOS_COLUMNAR_STOCK)
+    n = len(df)
+    errores = ErroresColumnar()
+
+    if "codigo" not in df:
+        errores.agregar(range(n), "Código", "Field required")
+        codigo = [None] * n
+    else:
+        codigo = df["codigo"]
+        no_texto = codigo.map(lambda v: not isinstance(v, str)).to_numpy(dtype=bool)
+        errores.agregar(codigo.index[no_texto], "Código", "Input should be a valid string")
+        codigo = codigo.tolist()
+
+    numeros = {}
+    for campo in ("stock", "stock_minimo", "stock_optimo"):
+        alias = CAMPOS_COLUMNAR_STOCK[campo][0]
+        numeros[campo] = a_float(df[campo], errores, alias).tolist() if campo in df else [0.0] * n
+    articulo = texto_opcional(df["articulo"], errores, "Artículo") if "articulo" in df else [None] * n
+    marca = texto_opcional(df["marca"], errores, "Marca") if "marca" in df else ["Sin Marca"] * n
+
+    errores.lanzar_si_hay()
+    return list(zip(codigo, articulo, numeros["stock"], numeros["stock_minimo"], numeros["stock_optimo"], marca))
+
+# --- CARGA MASIVA (COPY + MERGE) ---
+async def procesar_guardado_postgres(db: AsyncSession, filas: List[tuple], progreso=None):
+    """`filas`: tuplas en el orden de COLUMNAS_STOCK (ver filas_desde_modelos)."""
     print("\n" + "═"*60)
     # Limpiar duplicados que vengan en el mismo Excel antes de mandar a DB
-    diccionario_limpio = {f.codigo: f for f in datos}
-    datos_unicos = list(diccionario_limpio.values())
-    
-    print(f"📦 [STOCK] {len(datos)} recibidos -> {len(datos_unicos)} tras limpiar duplicados.")
-    
-    db = SessionLocal()
-    batch_size = 1000
-    total_afectados = 0
+    recibidas = len(filas)
+    filas = list({f[0]: f for f in filas}.values())
     
-    try:
-        for i in range(0, len(datos_unicos), batch_size):
-            batch = datos_unicos[i : i + batch_size]
-            listado_dicts = [fila.model_dump(by_alias=False) for fila in batch]
-            
-            stmt = insert(tabla_stock).values(listado_dicts)
-            statement_upsert = stmt.on_conflict_do_update(
-                index_elements=['codigo'], # Ahora sí funcionará porque la columna es UNIQUE
-                set_={
-                    "articulo": stmt.excluded.articulo,
-                    "stock": stmt.excluded.stock,
-                    "stock_minimo": stmt.excluded.stock_minimo,
-                    "stock_optimo": stmt.excluded.stock_optimo,
-                    "marca": stmt.excluded.marca
-                }
+    print(f"📦 [STOCK] {recibidas} recibidos -> {len(filas)} tras limpiar duplicados.")
+
+    inicio = time.perf_counter()
+    codigos = [f[0] for f in filas]
+
+    async def transaccion():
+        # Solo las filas nuevas o cambiadas van por COPY + merge, todo en una transacción
+        with etapa("upsert_db"):
+            conteo = await sincronizar_con_huellas(
+                db, tabla_stock, COLUMNAS_STOCK, ["codigo"], filas,
+                tabla_stock.c.codigo == any_(bindparam("codigos", codigos, type_=ARRAY(String))),
+                progreso,
             )
-            
-            with db.begin():
-                result = db.execute(statement_upsert)
-                total_afectados += result.rowcount
-            print(f"⏳ [STOCK] Progreso: {min(i + batch_size, len(datos_unicos))}...")
+        claves_cambiadas = conteo.pop("claves_cambiadas")
+        if conteo["insertados"] or conteo["actualizados"]:
+            if progreso:
+                progreso("actualizando catálogo", len(filas), len(filas))
+            # Catálogo combinado: solo los códigos que cambiaron, en la misma transacción
+            with etapa("refresco_catalogo"):
+                await refrescar_catalogo(db, [clave[0] for clave in claves_cambiadas])
+            # Se entrega a todos los workers recién con el commit
+            await avisar_cambio(db, cache_stock.nombre)
+        with etapa("commit"):
+            await db.commit()
+        return conteo
+
+    # Un corte de conexión o un deadlock repite la carga entera (hace rollback antes)
+    conteo = await con_reintentos(db, transaccion, "STOCK")
+    hubo_cambios = conteo["insertados"] or conteo["actualizados"]
+    if hubo_cambios:
+        # Este worker no espera al aviso: la próxima consulta ya ve los datos nuevos
+        cache_stock.invalidar()
+        cache_catalogo.invalidar()
+        try:
+            with etapa("indice_busqueda"):
+                await actualizar_indice_busqueda(db, "stock_items")
+        except Exception as e:
+            # Los datos ya están guardados: el índice se pone al día igual con el autovacuum
+            await db.rollback()
+            print(f"⚠️ [BÚSQUEDA] No se pudo actualizar el índice de stock_items: {e}")
+
+    segundos = time.perf_counter() - inicio
+    filas_por_segundo = len(filas) / segundos if segundos > 0 else 0.0
+    print(
+        f"✅ [STOCK] {len(filas)} filas en {segundos:.2f}s ({filas_por_segundo:.0f} filas/s): "
+        f"{conteo['insertados']} nuevas, {conteo['actualizados']} actualizadas, {conteo['sin_cambios']} sin cambios."
+    )
+    return {
+        "filas": len(filas),
+        **conteo,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(filas_por_segundo),
+    }
 
-        return total_afectados
-    finally:
-        db.close()
+async def _trabajo_stock(trabajo, filas: List[tuple]):
+    # El trabajo sobrevive a la petición: usa su propia sesión
+    async with AsyncSessionLocal() as db:
+        return await procesar_guardado_postgres(db, filas, progreso=trabajo.progreso)
+
+async def _subir_stock(filas: List[tuple], modo: str, db: AsyncSession):
+    if modo == "async":
+        return cola_trabajos.respuesta_aceptado(await cola_trabajos.encolar("upload-sheet", _trabajo_stock, filas))
+    try:
+        resultado = await procesar_guardado_postgres(db, filas)
+        return {
+            "status": "success",
+            "insertados": resultado["insertados"],
+            "actualizados": resultado["actualizados"],
+            "sin_cambios": resultado["sin_cambios"],
+            "filas_por_segundo": resultado["filas_por_segundo"],
+        }
+    except Exception as e:
+        print(f"❌ ERROR: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload-sheet")
-async def endpoint_stock(filas: List[FilaExcel]):
+async def endpoint_stock(filas: List[FilaExcel], modo: str = "sync", db: AsyncSession = Depends(get_db)):
+    """
+    Con ?modo=async responde 202 con un job_id enseguida y procesa en segundo plano
+    (429 con Retry-After si la cola de trabajos está llena); el avance se consulta en GET /jobs/{job_id}.
+    """
+    # Lectura del cuerpo, parseo del JSON y validación de pydantic las hizo FastAPI antes de llegar acá
+    registrar_etapa_desde_inicio("validacion")
+    return await _subir_stock(filas_desde_modelos(filas), modo, db)
+
+@router.post("/upload-sheet/columnar")
+async def endpoint_stock_columnar(request: Request, modo: str = "sync", db: AsyncSession = Depends(get_db)):
+    """
+    Mismo efecto que /upload-sheet con un cuerpo más liviano:
+    {"columnas": ["Código", "Artículo", "Stock", ...], "filas": [["A1", "Filtro", 3], ...]}
+    Acepta Content-Encoding: gzip. La validación se hace por columna (pandas) en vez de fila por fila.
+    """
+    with etapa("lectura_upload"):
+        columnas, filas_crudas = await leer_cuerpo_columnar(request)
+    with etapa("validacion"):
+        filas = await asyncio.to_thread(normalizar_columnar_stock, columnas, filas_crudas)
+    return await _subir_stock(filas, modo, db)
+
+
+class PaginaStock(BaseModel):
+    total_enviados: int
+    siguiente_cursor: Optional[str]
+    data: List[StockResponse]
+
+@router.get("/stock", response_model=Union[List[StockResponse], PaginaStock])
+async def obtener_todos_stock(
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO_PAGINA),
+    cursor: Optional[str] = None,
+    formato: str = "json",
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Sin parámetros devuelve todo el stock (una lista, como siempre la leyeron las planillas).
+    Paginado por id (keyset), igual que /precios y /catalogo: /stock?limit=1000 y luego
+    /stock?limit=1000&cursor=<siguiente_cursor> hasta que siguiente_cursor sea null.
+    Con ?formato=ndjson exporta toda la tabla en streaming (un artículo por línea).
+    """
+    if formato == "ndjson":
+        query = select(*COLUMNAS_PUBLICAS_STOCK).order_by(tabla_stock.c.id)
+        return exportar_ndjson(query, lambda fila: StockResponse(**fila).model_dump())
     try:
-        total = procesar_guardado_postgres(filas)
-        return {"status": "success", "cambios": total}
+        if limit is None and cursor is None:
+            filas = (await db.execute(select(*COLUMNAS_PUBLICAS_STOCK).order_by(tabla_stock.c.id))).mappings().all()
+            return [StockResponse(**fila) for fila in filas]
+        limit = limit or LIMITE_PAGINA_STOCK
+        query = paginar(select(*COLUMNAS_PUBLICAS_STOCK), [tabla_stock.c.id], cursor, limit)
+        filas = (await db.execute(query)).mappings().all()
+        filas, siguiente = separar_pagina(filas, ["id"], limit)
+        return {
+            "total_enviados": len(filas),
+            "siguiente_cursor": siguiente,
+            "data": [StockResponse(**fila) for fila in filas],
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ ERROR: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/stock", response_model=List[StockResponse])
-async def obtener_todos_stock():
-    """Obtiene todo el stock disponible"""
-    db = SessionLocal()
+# A reponer: hasta el óptimo, o hasta el mínimo si el óptimo no está cargado (o es menor).
+# El mejor precio sigue la regla del catálogo combinado: el menor > 0, y a igualdad el proveedor.
+_SQL_REPOSICION = text("""
+    SELECT s.codigo, s.articulo, s.marca, s.stock, s.stock_minimo, s.stock_optimo,
+           GREATEST(s.stock_optimo, s.stock_minimo) - s.stock AS a_reponer,
+           p.proveedor, p.cod_prov, p.precio_final,
+           (GREATEST(s.stock_optimo, s.stock_minimo) - s.stock) * p.precio_final AS costo_estimado
+    FROM stock_items s
+    LEFT JOIN LATERAL (
+        SELECT lp.proveedor, lp.cod_prov, lp.precio_final
+        FROM lista_precios lp
+        WHERE lp.codigo = s.codigo AND lp.precio_final > 0
+        ORDER BY lp.precio_final, lp.proveedor
+        LIMIT 1
+    ) p ON true
+    WHERE s.stock < s.stock_minimo
+    ORDER BY s.codigo
+""")
+
+COLUMNAS_REPOSICION = [
+    "codigo", "articulo", "marca", "stock", "stock_minimo", "stock_optimo",
+    "a_reponer", "proveedor", "cod_prov", "precio_final", "costo_estimado",
+]
+
+# Tiene que ir antes de /stock/{codigo}, si no "reposicion" se toma como un código
+@router.get("/stock/reposicion")
+async def exportar_reposicion(formato: str = "csv"):
+    """
+    Artículos con stock por debajo del mínimo, con la cantidad a reponer y el mejor
+    precio entre proveedores (y el costo estimado de la reposición).
+    Uso: /stock/reposicion (CSV en streaming) o /stock/reposicion?formato=xlsx
+    """
+    if formato == "csv":
+        return exportar_csv(_SQL_REPOSICION, COLUMNAS_REPOSICION, "reposicion.csv")
+    if formato == "xlsx":
+        try:
+            return await exportar_xlsx(_SQL_REPOSICION, COLUMNAS_REPOSICION, "reposicion.xlsx", "Reposición")
+        except Exception as e:
+            print(f"❌ ERROR: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    raise HTTPException(status_code=400, detail="formato debe ser 'csv' o 'xlsx'")
+
+
+@router.post("/stock/lookup")
+async def buscar_stock_por_lote(consulta: ConsultaLoteStock, db: AsyncSession = Depends(get_db)):
+    """
+    Resuelve muchos códigos en una sola consulta (en vez de un GET /stock/{codigo} por código).
+    Body: {"codigos": [...]}
+    Respuesta: {"encontrados": {codigo: {...}}, "no_encontrados": [...]}
+    """
     try:
-        resultado = db.execute(tabla_stock.select())
-        items = resultado.fetchall()
-        db.close()
-        
-        if not items:
-            return []
-        
-        return [
-            StockResponse(
-                id=item[0],
-                codigo=item[1],
-                articulo=item[2],
-                stock=item[3],
-                stock_minimo=item[4],
-                stock_optimo=item[5],
-                marca=item[6]
+        # Sin repetidos y en el orden recibido
+        codigos = list(dict.fromkeys(str(c).strip() for c in consulta.codigos))
+
+        # Los que ya están en la caché no van a la base
+        encontrados, pendientes = {}, []
+        for codigo in codigos:
+            item = cache_stock.obtener(codigo)
+            if item is FALTA:
+                pendientes.append(codigo)
+            elif item is not None:
+                encontrados[codigo] = item
+
+        if pendientes:
+            version = cache_stock.version
+            query = select(*COLUMNAS_PUBLICAS_STOCK).where(
+                tabla_stock.c.codigo == any_(bindparam("codigos", pendientes, type_=ARRAY(String)))
             )
-            for item in items
-        ]
+            filas = {fila["codigo"]: fila for fila in (await db.execute(query)).mappings()}
+            for codigo in pendientes:
+                item = StockResponse(**filas[codigo]) if codigo in filas else None
+                cache_stock.guardar(codigo, item, version)
+                if item is not None:
+                    encontrados[codigo] = item
+
+        return {
+            "encontrados": {codigo: encontrados[codigo] for codigo in codigos if codigo in encontrados},
+            "no_encontrados": [codigo for codigo in codigos if codigo not in encontrados],
+        }
     except Exception as e:
-        db.close()
         print(f"❌ ERROR: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/stock/{codigo}", response_model=StockResponse)
-async def obtener_stock_por_codigo(codigo: str):
-    """Obtiene un producto específico por código"""
-    db = SessionLocal()
+async def obtener_stock_por_codigo(codigo: str, db: AsyncSession = Depends(get_db)):
+    """Obtiene un producto específico por código (cacheado en memoria hasta la próxima subida)"""
     try:
-        resultado = db.execute(tabla_stock.select().where(tabla_stock.c.codigo == codigo))
-        item = resultado.fetchone()
-        db.close()
-        
+        item = cache_stock.obtener(codigo)
+        if item is FALTA:
+            version = cache_stock.version
+            resultado = await db.execute(select(*COLUMNAS_PUBLICAS_STOCK).where(tabla_stock.c.codigo == codigo))
+            fila = resultado.mappings().first()
+            # Los "no encontrado" también se guardan: los lectores escanean códigos inexistentes seguido
+            item = StockResponse(**fila) if fila else None
+            cache_stock.guardar(codigo, item, version)
+
         if not item:
             raise HTTPException(status_code=404, detail=f"Producto '{codigo}' no encontrado")
         
-        return StockResponse(
-            id=item[0],
-            codigo=item[1],
-            articulo=item[2],
-            stock=item[3],
-            stock_minimo=item[4],
-            stock_optimo=item[5],
-            marca=item[6]
-        )
+        return item
     except HTTPException:
         raise
     except Exception as e:
-        db.close()
         print(f"❌ ERROR: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,31 @@
+import os
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+import cola_trabajos
+
+router = APIRouter()
+
+@router.get("/jobs/{id_trabajo}")
+def estado_trabajo(id_trabajo: str):
+    """
+    Avance de un trabajo lanzado con ?modo=async: estado (en_cola, procesando,
+    completado, error, interrumpido), etapa, procesadas/total, velocidad, ETA
+    y, al terminar, el resultado (los mismos conteos que el modo sincrónico).
+    """
+    estado = cola_trabajos.obtener(id_trabajo)
+    if estado is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo '{id_trabajo}' no encontrado")
+    return estado
+
+@router.get("/jobs/{id_trabajo}/resultado")
+def resultado_trabajo(id_trabajo: str):
+    """Datos completos de un trabajo que los generó (ej: los items de /procesar-inventario-completo/)."""
+    estado = cola_trabajos.obtener(id_trabajo)
+    if estado is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo '{id_trabajo}' no encontrado")
+    if estado["estado"] != "completado":
+        raise HTTPException(status_code=409, detail=f"El trabajo está '{estado['estado']}'")
+    ruta = cola_trabajos.ruta_resultado(id_trabajo)
+    if not os.path.exists(ruta):
+        return estado["resultado"]
+    return FileResponse(ruta, media_type="application/json")